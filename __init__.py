@@ -1,2 +1,50 @@
 # Main package initialization
 __version__ = "0.1.0"
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Set up the queue-backed package logger before any node module logs
+from shopping_assistant import logger_config  # noqa: F401
+
+
+def _build_client():
+    from shopping_assistant.llm_client import build_client
+    return build_client()
+
+
+def _load_embedding_model():
+    from shopping_assistant.embedder import load_model
+    return load_model()
+
+
+def _load_intent_model():
+    from shopping_assistant.config import INTENT_MODEL_DIR
+    from shopping_assistant.utils.local_classifier import load_onnx_classifier
+    return load_onnx_classifier(INTENT_MODEL_DIR)
+
+
+def _load_moderation_model():
+    from shopping_assistant.config import GUARDRAILS_MODEL_DIR
+    from shopping_assistant.utils.local_classifier import load_onnx_classifier
+    return load_onnx_classifier(GUARDRAILS_MODEL_DIR)
+
+
+# The Azure client and the local models are independent, so they are built in
+# parallel at import: cold start pays for the slowest of them, not their sum
+_preload_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="preload")
+_preloads = {
+    "client": _preload_executor.submit(_build_client),
+    "embedding_model": _preload_executor.submit(_load_embedding_model),
+    "intent_model": _preload_executor.submit(_load_intent_model),
+    "moderation_model": _preload_executor.submit(_load_moderation_model),
+}
+_preload_executor.shutdown(wait=False)
+
+
+def __getattr__(name):
+    """Preloaded clients and models; the first access waits for initialization to finish"""
+    future = _preloads.get(name)
+    if future is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = future.result()
+    return value
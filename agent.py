@@ -1,8 +1,75 @@
+import logging
 from shopping_assistant.graph import create_product_search_graph
 from shopping_assistant.schema import ShoppingCart, ConversationMemory
 from shopping_assistant.state import ProductSearchState
 from langchain_core.messages import HumanMessage
-from typing import Optional
+import asyncio
+import threading
+from typing import AsyncIterator, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Immutable per-turn defaults; copied into each turn's initial state
+_STATIC_DEFAULTS = {
+    # Intent & processing
+    "intent": "",
+    "intent_confidence": 0.0,
+
+    # SQL
+    "sql_query": "",
+    "sql_results": "",
+
+    # Cart
+    "cart_action": "",
+
+    # Safety
+    "is_safe": True,
+    "is_in_domain": True,
+    "domain_confidence": 1.0,
+
+    # Memory & flow
+    "needs_clarification": False,
+    "clarification_question": "",
+
+    # Supervisor
+    "next_action": "",
+    "supervisor_reasoning": "",
+
+    # Final response
+    "agent_response": "",
+}
+
+# Sync callers (chat/stream_chat) run the async graph on one background loop shared
+# by every agent, so the per-loop LLM connection pool and batchers live for the whole
+# process and no loop is left open per agent
+_shared_loop: Optional[asyncio.AbstractEventLoop] = None
+_shared_loop_lock = threading.Lock()
+
+
+def _get_shared_loop() -> asyncio.AbstractEventLoop:
+    global _shared_loop
+    with _shared_loop_lock:
+        if _shared_loop is None:
+            _shared_loop = asyncio.new_event_loop()
+            threading.Thread(target=_shared_loop.run_forever, name="agent-loop", daemon=True).start()
+        return _shared_loop
+
+
+async def _anext(stream: AsyncIterator[str]) -> str:
+    return await stream.__anext__()
+
+
+def _run_on_shared_loop(coro):
+    """Run coro on the shared loop and wait for it; safe to call while another loop is running"""
+    loop = _get_shared_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("chat()/stream_chat() cannot block the agent loop; use achat()/astream_chat() there")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
 
 
 class ProductSearchAgent:
@@ -12,62 +79,79 @@ class ProductSearchAgent:
         self.conversation_memory = ConversationMemory()
         self.turn_count = 0
 
-    def chat(self, user_input: str, image_path: Optional[str] = None) -> str:
+    def _build_initial_state(self, user_input: str, image_path: Optional[str]) -> ProductSearchState:
         self.turn_count += 1
-        print(f"\n🔄 Turn {self.turn_count} | User: {user_input}")
+        logger.debug("🔄 Turn %s | User: %s", self.turn_count, user_input)
 
-        initial_state: ProductSearchState = {
+        initial_state: ProductSearchState = dict(_STATIC_DEFAULTS)
+        initial_state.update({
             "user_input": user_input,
             "has_image": bool(image_path),
             "image_path": image_path,
 
-            # Intent & processing
-            "intent": "",
-            "intent_confidence": 0.0,
+            # Mutable defaults are created fresh for every turn
             "raw_entities": {},
             "stitched_entities": {},
             "search_results": [],
-
-            # SQL
-            "sql_query": "",
-            "sql_results": "",
-
-            # Cart
-            "shopping_cart": self.shopping_cart,
-            "cart_action": "",
             "selected_product": {},
-
-            # Safety
-            "is_safe": True,
             "safety_issues": [],
-            "is_in_domain": True,
-            "domain_confidence": 1.0,
 
-            # Memory & flow
+            # Session objects
+            "shopping_cart": self.shopping_cart,
             "conversation_memory": self.conversation_memory,
             "turn_count": self.turn_count,
-            "needs_clarification": False,
-            "clarification_question": "",
 
-            # Supervisor
-            "next_action": "",
-            "supervisor_reasoning": "",
-
-            # Final response
-            "agent_response": "",
             "messages": [HumanMessage(content=user_input)]
-        }
-
-        final_state = self.app.invoke(initial_state)
+        })
+        return initial_state
 
+    def _finish_turn(self, final_state: ProductSearchState) -> str:
         # Sync memory and cart back
         self.shopping_cart = final_state["shopping_cart"]
         self.conversation_memory = final_state["conversation_memory"]
 
         return final_state["agent_response"]
 
+    def chat(self, user_input: str, image_path: Optional[str] = None) -> str:
+        # Input analysis nodes are async, so the graph always runs through ainvoke on
+        # the shared loop; this also works from a thread whose own loop is running
+        return _run_on_shared_loop(self.achat(user_input, image_path))
+
+    async def achat(self, user_input: str, image_path: Optional[str] = None) -> str:
+        """Async variant of chat() for callers running inside an event loop (e.g. FastAPI)."""
+        initial_state = self._build_initial_state(user_input, image_path)
+        final_state = await self.app.ainvoke(initial_state)
+        return self._finish_turn(final_state)
+
+    async def astream_chat(self, user_input: str, image_path: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Yield the reply in pieces as nodes write it to the custom stream. Nodes that
+        do not stream (cart, unsafe input) have their full reply yielded at the end.
+        """
+        initial_state = self._build_initial_state(user_input, image_path)
+        final_state = initial_state
+        streamed = False
+        async for mode, chunk in self.app.astream(initial_state, stream_mode=["custom", "values"]):
+            if mode == "custom":
+                streamed = True
+                yield chunk
+            else:
+                final_state = chunk
+        response = self._finish_turn(final_state)
+        if not streamed:
+            yield response
+
+    def stream_chat(self, user_input: str, image_path: Optional[str] = None) -> Iterator[str]:
+        """Sync wrapper over astream_chat, driven on the shared agent loop"""
+        stream = self.astream_chat(user_input, image_path)
+        while True:
+            try:
+                yield _run_on_shared_loop(_anext(stream))
+            except StopAsyncIteration:
+                return
+
     def reset_conversation(self):
         self.shopping_cart = ShoppingCart()
         self.conversation_memory = ConversationMemory()
         self.turn_count = 0
-        print("🔄 Conversation and cart reset.")
+        logger.debug("🔄 Conversation and cart reset.")
@@ -16,3 +16,24 @@ EMBEDDING_URL = os.getenv("EMBEDDING_URL", "http://44.200.93.203:6006")
 
 # Authorization Token
 AUTH_TOKEN = os.getenv("AUTH_TOKEN", "your_default_jwt_token")
+
+# LLM Response Cache Configuration
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
+# Local Intent Classifier (ONNX export of a fine-tuned MiniLM; empty disables it)
+INTENT_MODEL_DIR = os.getenv("INTENT_MODEL_DIR", "")
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.85"))
+
+# Local Moderation Model (int8 ONNX export of unitary/unbiased-toxic-roberta; empty disables it)
+# Max harm score below SAFE_BELOW allows, above UNSAFE_ABOVE blocks/warns, in between asks the LLM
+GUARDRAILS_MODEL_DIR = os.getenv("GUARDRAILS_MODEL_DIR", "")
+GUARDRAILS_SAFE_BELOW = float(os.getenv("GUARDRAILS_SAFE_BELOW", "0.2"))
+GUARDRAILS_UNSAFE_ABOVE = float(os.getenv("GUARDRAILS_UNSAFE_ABOVE", "0.8"))
+
+# Shared Sentence Embedder (semantic cache and other local similarity lookups)
+EMBEDDER_MODEL = os.getenv("EMBEDDER_MODEL", "BAAI/bge-small-en-v1.5")
+
+# Clarification Checker (search results scoring at or below this are dropped)
+CLARIFICATION_SCORE_THRESHOLD = float(os.getenv("CLARIFICATION_SCORE_THRESHOLD", "0.6"))
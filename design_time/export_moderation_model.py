@@ -0,0 +1,39 @@
+"""
+Export unitary/unbiased-toxic-roberta to ONNX and quantize it to int8 for guardrails.
+
+The output directory is what GUARDRAILS_MODEL_DIR points at: model.onnx (int8),
+tokenizer files and labels.json.
+
+    python export_moderation_model.py ../models/moderation
+"""
+import os
+import sys
+import json
+
+from transformers import AutoTokenizer
+from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+MODEL_ID = "unitary/unbiased-toxic-roberta"
+
+
+def export(out_dir):
+    fp32_dir = os.path.join(out_dir, "fp32")
+    model = ORTModelForSequenceClassification.from_pretrained(MODEL_ID, export=True)
+    model.save_pretrained(fp32_dir)
+
+    # Dynamic int8 quantization; avx512_vnni falls back gracefully on older CPUs
+    quantizer = ORTQuantizer.from_pretrained(fp32_dir)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=out_dir, quantization_config=qconfig)
+    os.replace(os.path.join(out_dir, "model_quantized.onnx"), os.path.join(out_dir, "model.onnx"))
+
+    AutoTokenizer.from_pretrained(MODEL_ID).save_pretrained(out_dir)
+    id2label = model.config.id2label
+    with open(os.path.join(out_dir, "labels.json"), "w") as f:
+        json.dump([id2label[i] for i in range(len(id2label))], f)
+    print(f"✅ Exported int8 moderation model to {out_dir}")
+
+
+if __name__ == "__main__":
+    export(sys.argv[1])
@@ -0,0 +1,70 @@
+"""
+Fine-tune MiniLM + a linear head for intent classification and export it to ONNX.
+
+Input is a JSONL file of {"text": ..., "label": ...} rows, e.g. user turns labelled
+from logged intent_classifier output. The output directory is what INTENT_MODEL_DIR
+points at: model.onnx, tokenizer files and labels.json.
+
+    python train_intent_classifier.py intents.jsonl ../models/intent
+"""
+import os
+import sys
+import json
+
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+BASE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+LABELS = ["product_search", "faq", "clarification_response", "modification", "continuation"]
+
+
+def load_examples(path):
+    with open(path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [r["text"] for r in rows], [LABELS.index(r["label"]) for r in rows]
+
+
+def train(texts, labels, epochs=4, batch_size=16, lr=5e-5):
+    tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL)
+    model = AutoModelForSequenceClassification.from_pretrained(BASE_MODEL, num_labels=len(LABELS))
+    optimizer = torch.optim.AdamW(model.parameters(), lr=lr)
+
+    model.train()
+    for epoch in range(epochs):
+        order = torch.randperm(len(texts)).tolist()
+        total = 0.0
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            batch = tokenizer([texts[i] for i in idx], padding=True, truncation=True, max_length=128, return_tensors="pt")
+            out = model(**batch, labels=torch.tensor([labels[i] for i in idx]))
+            out.loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+            total += out.loss.item()
+        print(f"📉 Epoch {epoch + 1}: loss {total:.4f}")
+
+    return tokenizer, model.eval()
+
+
+def export(tokenizer, model, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    dummy = tokenizer("find a red shirt", return_tensors="pt")
+    torch.onnx.export(
+        model,
+        (dummy["input_ids"], dummy["attention_mask"]),
+        os.path.join(out_dir, "model.onnx"),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "seq"}, "attention_mask": {0: "batch", 1: "seq"}},
+        opset_version=17,
+    )
+    tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, "labels.json"), "w") as f:
+        json.dump(LABELS, f)
+    print(f"✅ Exported to {out_dir}")
+
+
+if __name__ == "__main__":
+    texts, labels = load_examples(sys.argv[1])
+    tokenizer, model = train(texts, labels)
+    export(tokenizer, model, sys.argv[2])
@@ -9,15 +9,15 @@ session = Session()
 def print_tshirts():
     print("\n🧵 T-SHIRTS")
     results = (
-        session.query(Product)
+        session.query(Product, TShirtAttributes)
         .join(ProductType).join(Subcategory).join(Category)
         .join(TShirtAttributes)
         .options(joinedload(Product.product_type).joinedload(ProductType.subcategory).joinedload(Subcategory.category))
         .all()
     )
 
-    for p in results:
-        attrs = session.query(TShirtAttributes).filter_by(product_id=p.product_id).first()
+    # Attributes come back with each product from the join above, no per-row lookup
+    for p, attrs in results:
         print(f"📦 {p.product_name} | {p.brand} | ₹{p.price_inr}")
         print(f"  - Category: {p.product_type.subcategory.category.category_name}")
         print(f"  - Subcategory: {p.product_type.subcategory.subcategory_name}")
@@ -28,15 +28,15 @@ def print_tshirts():
 def print_tvs():
     print("\n📺 TELEVISIONS")
     results = (
-        session.query(Product)
+        session.query(Product, TVAttributes)
         .join(ProductType).join(Subcategory).join(Category)
         .join(TVAttributes)
         .options(joinedload(Product.product_type).joinedload(ProductType.subcategory).joinedload(Subcategory.category))
         .all()
     )
 
-    for p in results:
-        attrs = session.query(TVAttributes).filter_by(product_id=p.product_id).first()
+    # Attributes come back with each product from the join above, no per-row lookup
+    for p, attrs in results:
         print(f"📦 {p.product_name} | {p.brand} | ₹{p.price_inr}")
         print(f"  - Category: {p.product_type.subcategory.category.category_name}")
         print(f"  - Subcategory: {p.product_type.subcategory.subcategory_name}")
@@ -0,0 +1,95 @@
+import logging
+import asyncio
+import weakref
+from typing import List, Optional
+
+import numpy as np
+
+import shopping_assistant
+from shopping_assistant.config import EMBEDDER_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Requests arriving within this window are encoded in one batch
+FLUSH_INTERVAL_SECONDS = 0.005
+
+
+def load_model():
+    """Load the sentence embedder (fp16 on GPU); None if it is unavailable or fails to load"""
+    try:
+        import torch
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logger.warning("⚠️ sentence-transformers not installed, local embeddings disabled")
+        return None
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    try:
+        model = SentenceTransformer(EMBEDDER_MODEL, device=device)
+        if device == "cuda":
+            model.half()
+    except Exception as e:
+        logger.warning("⚠️ Could not load embedder %s, local embeddings disabled: %s", EMBEDDER_MODEL, e)
+        return None
+    logger.debug("✅ Embedder ready: %s on %s", EMBEDDER_MODEL, device)
+    return model
+
+
+def embed_batch(texts: List[str]) -> Optional[np.ndarray]:
+    """Normalized embeddings for texts, shape (len(texts), dim); None without a model"""
+    # Preloaded at package import so the first turn that needs an embedding does not pay for it
+    model = shopping_assistant.embedding_model
+    if model is None:
+        return None
+    return model.encode(texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True)
+
+
+class EmbeddingBatcher:
+    """Collects embed() calls from concurrent nodes and encodes them together every few ms"""
+
+    def __init__(self, interval: float = FLUSH_INTERVAL_SECONDS):
+        self.interval = interval
+        self._pending: List[tuple] = []
+        self._flush_handle = None
+
+    def submit(self, text: str) -> "asyncio.Future[np.ndarray]":
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.interval, self._flush)
+        return future
+
+    def _flush(self):
+        batch, self._pending = self._pending, []
+        self._flush_handle = None
+        # model.encode blocks, so it runs in the default executor instead of stalling the loop
+        encoding = asyncio.get_running_loop().run_in_executor(None, embed_batch, [text for text, _ in batch])
+        encoding.add_done_callback(lambda done: self._resolve(batch, done))
+
+    @staticmethod
+    def _resolve(batch: List[tuple], done: "asyncio.Future[np.ndarray]"):
+        error = done.exception()
+        vectors = done.result() if error is None else None
+        for i, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(vectors[i])
+
+
+# One batcher per event loop; its futures and timer belong to that loop
+_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, EmbeddingBatcher]" = weakref.WeakKeyDictionary()
+
+
+async def embed(text: str) -> Optional[np.ndarray]:
+    """Embed one text, batched with other embed() calls on the same event loop"""
+    if shopping_assistant.embedding_model is None:
+        return None
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = _batchers[loop] = EmbeddingBatcher()
+    return await batcher.submit(text)
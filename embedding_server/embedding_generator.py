@@ -1,33 +1,76 @@
+import io
 import os
+import json
 import pickle
+import logging
+import asyncio
 import numpy as np
+import torch
 from typing import List, Dict, Any, Optional
-from PIL import Image
-import tempfile
 
 import sys
 sys.path.append('../')
 from logger_config import logger
 # from config import TEXT_CHUNK_WEIGHT, TEXT_CONTEXT_WEIGHT, IMAGE_CONTENT_WEIGHT, IMAGE_DESCRIPTION_WEIGHT
 
+# Allow TF32 tensor cores for any remaining fp32 matmuls (Ampere+ GPUs)
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.allow_tf32 = True
+
 class EmbeddingGenerator:
     """
     A class to generate and manage embeddings for text and image content.
     """
     
-    def __init__(self, model_name="llamaindex/vdr-2b-multi-v1", device="cuda:0"):
+    def __init__(self, model_name="llamaindex/vdr-2b-multi-v1", device="cuda:0", batch_size=None, preload=True,
+                 store_dtype=None):
         """
         Initialize the EmbeddingGenerator.
         
         Args:
             model_name: Name of the embedding model to use
             device: Device to run the model on (cuda:0, cpu, etc.)
+            batch_size: Max inputs per forward pass (defaults to EMBED_BATCH_SIZE env var, or 32)
+            preload: Load the model immediately; pass False to defer it to load_model()/create()
+            store_dtype: NumPy dtype for stored chunk embeddings, e.g. "float16" (defaults to
+                EMBED_STORE_DTYPE env var; unset keeps plain Python float lists)
         """
         self.model_name = model_name
         self.device = device
+        self.batch_size = batch_size or int(os.getenv("EMBED_BATCH_SIZE", "32"))
+        store_dtype = store_dtype or os.getenv("EMBED_STORE_DTYPE")
+        self.store_dtype = np.dtype(store_dtype) if store_dtype else None
         self.model = None
+        # Only one forward pass in flight; CPU-side prep of other batches overlaps with it
+        self._model_lock = asyncio.Semaphore(1)
+        # Micro-batching of concurrent single-text and single-image requests (see _submit)
+        self.max_query_batch = int(os.getenv("EMBED_MAX_BATCH", "32"))
+        self.max_query_wait = float(os.getenv("EMBED_MAX_WAIT_MS", "4")) / 1000
+        self._query_queue = None
+        self._query_batcher = None
+        self._image_queue = None
+        self._image_batcher = None
+        if preload:
+            self._load_model_sync()
+    
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        """
+        Build an EmbeddingGenerator and load its model once, e.g. from a server startup hook.
+        """
+        instance = cls(*args, preload=False, **kwargs)
+        await instance.load_model()
+        return instance
         
     async def load_model(self):
+        """
+        Load the embedding model if it is not loaded yet.
+        """
+        if self.model is None:
+            self._load_model_sync()
+        self._ensure_batchers()
+    
+    def _load_model_sync(self):
         """
         Load the embedding model.
         """
@@ -36,11 +79,14 @@ class EmbeddingGenerator:
             from llama_index.core import Document
             from langchain_community.vectorstores import FAISS
             
-            logger.info(f"Loading embedding model: {self.model_name}")
+            torch_dtype = self._select_dtype()
+            logger.info(f"Loading embedding model: {self.model_name} ({torch_dtype})")
             self.model = HuggingFaceEmbedding(
                 model_name=self.model_name,
                 device=self.device,
                 trust_remote_code=True,
+                embed_batch_size=self.batch_size,
+                model_kwargs={"torch_dtype": torch_dtype},
             )
             logger.info("Embedding model loaded successfully")
             
@@ -48,221 +94,497 @@ class EmbeddingGenerator:
             logger.error(f"Error loading vdr embedding model: {e}")
             raise RuntimeError(f"Failed to load vdr embedding model: {e}")
     
+    def _select_dtype(self):
+        """
+        Pick the weight dtype: bfloat16 on GPUs that support it, float16 on
+        older GPUs (e.g. V100), float32 on CPU.
+        """
+        if not self.device.startswith("cuda") or not torch.cuda.is_available():
+            return torch.float32
+        if torch.cuda.is_bf16_supported():
+            return torch.bfloat16
+        return torch.float16
+    
+    async def _run_model(self, fn, *args, **kwargs):
+        """
+        Run a blocking model call in a worker thread, one at a time.
+        """
+        async with self._model_lock:
+            return await asyncio.to_thread(self._inference, fn, *args, **kwargs)
+    
+    @staticmethod
+    def _inference(fn, *args, **kwargs):
+        """
+        Call fn with autograd disabled (inference_mode is per-thread, so it is set here).
+        """
+        with torch.inference_mode():
+            return fn(*args, **kwargs)
+    
+    def _to_storage(self, vec):
+        """
+        Convert an embedding vector to the configured storage dtype.
+        
+        With store_dtype="float16" a 1536-d vector takes ~3 KB as an ndarray instead
+        of ~45 KB as a list of Python floats. Callers doing similarity math should
+        upcast with .astype(np.float32).
+        """
+        if self.store_dtype is None:
+            return vec
+        return np.asarray(vec, dtype=self.store_dtype)
+    
+    async def _embed_text_batch(self, texts):
+        """
+        Embed a list of texts in batches, grouping similar lengths together.
+        
+        Texts are sorted by character length (a cheap proxy for token count) so
+        each batch pads to roughly its own length, then results are returned
+        in the original order.
+        """
+        if not texts:
+            return []
+        
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        sorted_vecs = await self._run_model(
+            self.model.get_text_embedding_batch, [texts[i] for i in order], show_progress=False
+        )
+        
+        vecs = [None] * len(texts)
+        for pos, i in enumerate(order):
+            vecs[i] = sorted_vecs[pos]
+        return vecs
+    
+    async def _embed_image_batch(self, image_sources):
+        """
+        Embed image paths or in-memory image streams in one batched model call.
+        """
+        if not image_sources:
+            return []
+        # Streams may have been partly read by an earlier failed attempt
+        for source in image_sources:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+        return await self._run_model(self.model.get_image_embedding_batch, image_sources, show_progress=False)
+    
+    @staticmethod
+    async def _embed_each(embed_batch, items, labels):
+        """
+        Embed items one at a time after a batched call failed, so one bad item
+        does not cost the rest. Failed items are logged and come back as None.
+        """
+        vecs = []
+        for item, label in zip(items, labels):
+            try:
+                vecs.append((await embed_batch([item]))[0])
+            except Exception as e:
+                logger.error(f"Error generating embedding for {label}: {e}")
+                vecs.append(None)
+        return vecs
+    
+    def _ensure_batchers(self):
+        """
+        Start the background query and image batchers on the running event loop if needed.
+        """
+        loop = asyncio.get_running_loop()
+        if self._query_batcher is None or self._query_batcher.done():
+            self._query_queue = asyncio.Queue()
+            self._query_batcher = loop.create_task(self._run_batcher(self._query_queue, self._embed_queries))
+        if self._image_batcher is None or self._image_batcher.done():
+            self._image_queue = asyncio.Queue()
+            self._image_batcher = loop.create_task(self._run_batcher(self._image_queue, self._embed_images))
+    
+    def _embed_queries(self, texts):
+        """
+        Embed several query strings in one forward pass.
+        
+        HuggingFaceEmbedding has no public batched query API; _embed with the
+        "query" prompt is what get_query_embedding itself uses for one string.
+        """
+        if hasattr(self.model, '_embed'):
+            return self.model._embed(texts, prompt_name="query")
+        return [self.model.get_query_embedding(text) for text in texts]
+    
+    def _embed_images(self, sources):
+        """
+        Embed several images (paths or file-like objects) in one batched call.
+        """
+        return self.model.get_image_embedding_batch(sources, show_progress=False)
+    
+    async def _run_batcher(self, queue, embed_fn):
+        """
+        Collect inputs arriving on queue within max_query_wait and embed them together.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_query_wait
+            while len(batch) < self.max_query_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                vecs = await self._run_model(embed_fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), vec in zip(batch, vecs):
+                if not future.done():
+                    future.set_result(vec)
+    
+    async def _submit(self, kind, item):
+        """
+        Queue a single input ("query" or "image") for its micro-batcher and wait for its embedding.
+        """
+        self._ensure_batchers()
+        queue = self._query_queue if kind == "query" else self._image_queue
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((item, future))
+        return await future
+    
+    async def _submit_query(self, text):
+        return await self._submit("query", text)
+    
     async def generate_image_embedding(self, image_path: str):
         if not self.model:
             raise RuntimeError("Model not loaded")
-        return self.model.get_image_embedding(image_path)
+        return await self._submit("image", image_path)
     
-    async def generate_text_embeddings(self, enriched_text_chunks):
+    async def generate_image_embedding_from_bytes(self, data: bytes):
+        """
+        Generate an embedding for an image held in memory, without a temp file.
+        
+        Concurrent uploads are coalesced into one batched forward pass. The bytes
+        are still encoded (PNG/JPEG) and are decoded to pixels by PIL on the CPU,
+        so staging them in pinned memory would not speed up the host-to-device
+        copy; that copy happens on the processor's pixel tensors.
+        """
+        if not self.model:
+            raise RuntimeError("Model not loaded")
+        return await self._submit("image", io.BytesIO(data))
+    
+    async def generate_text_embeddings(self, enriched_text_chunks, copy=False):
         """
         Generate embeddings for text chunks.
         
+        The chunk dictionaries are updated in place with 'chunk_embedding' and
+        'context_embedding' unless copy=True.
+        
         Args:
             enriched_text_chunks: List of enriched text chunks
+            copy: Work on shallow copies instead of mutating the input chunks
             
         Returns:
             List of dictionaries with text chunks and their separate embeddings
         """
-        if self.model is None:
-            await self.load_model()
-            
         logger.info(f"Generating embeddings for {len(enriched_text_chunks)} text chunks")
-        logger.info("Storing separate embeddings for chunk content and context")
+        logger.debug("Storing separate embeddings for chunk content and context")
         
         text_embeddings = []
+        texts = []
+        contexts = []
+        context_idx = []
+        chunk_numbers = []
         
         for i, chunk in enumerate(enriched_text_chunks):
-            try:
-                # Extract text content and context
-                chunk_text = chunk.get('embedding_content_texts', '')
-                context = chunk.get('generated_context', 'self-contained')
-                heading = chunk.get('metadata', {}).get('heading', '')
-                
-                # Skip if no content
-                if not chunk_text:
-                    logger.warning(f"Skipping chunk {i+1} - no content")
-                    logger.info(f" Skipping Chunk {i+1} : {chunk}")
-                    continue
-                
-                # Get embeddings for the chunk text
-                chunk_embedding = np.array(self.model.get_query_embedding(chunk_text))
-                
-                # Create a copy of the chunk and add the embeddings
-                enriched_chunk = chunk.copy()
-                enriched_chunk['chunk_embedding'] = chunk_embedding.tolist()
-                
-                # Only get context embedding if it's not "self-contained"
-                if context and context != "self-contained":
-                    context_embedding = np.array(self.model.get_query_embedding(context))
-                    enriched_chunk['context_embedding'] = context_embedding.tolist()
-                else:
-                    enriched_chunk['context_embedding'] = None
-                
-                text_embeddings.append(enriched_chunk)
-                
-                if (i + 1) % 10 == 0:
-                    logger.info(f"Processed {i+1}/{len(enriched_text_chunks)} text chunks")
-                
-            except Exception as e:
-                logger.error(f"Error generating embedding for text chunk {i+1}: {e}")
+            # Extract text content and context
+            chunk_text = chunk.get('embedding_content_texts', '')
+            context = chunk.get('generated_context', 'self-contained')
+            
+            # Skip if no content
+            if not chunk_text:
+                logger.warning(f"Skipping chunk {i+1} - no content")
+                logger.debug("Skipping chunk %d: %s", i + 1, chunk)
+                continue
+            
+            # Embeddings are filled in after the batched calls
+            enriched_chunk = chunk.copy() if copy else chunk
+            enriched_chunk['context_embedding'] = None
+            text_embeddings.append(enriched_chunk)
+            texts.append(chunk_text)
+            chunk_numbers.append(i + 1)
+            
+            # Only embed the context if it's not "self-contained"
+            if context and context != "self-contained":
+                context_idx.append(len(text_embeddings) - 1)
+                contexts.append(context)
+        
+        # Chunk texts and contexts share one length-sorted batched call, so short
+        # contexts pack into the same batches as short chunks
+        try:
+            vecs = await self._embed_text_batch(texts + contexts)
+        except Exception as e:
+            logger.error(f"Error generating embeddings for text chunks, retrying one by one: {e}")
+            labels = [f"text chunk {n}" for n in chunk_numbers]
+            labels += [f"context of text chunk {chunk_numbers[idx]}" for idx in context_idx]
+            vecs = await self._embed_each(self._embed_text_batch, texts + contexts, labels)
+        chunk_vecs, context_vecs = vecs[:len(texts)], vecs[len(texts):]
+        
+        # A chunk whose text or context failed is skipped, as a whole
+        failed = set()
+        for idx, chunk_vec in enumerate(chunk_vecs):
+            if chunk_vec is None:
+                failed.add(idx)
+            else:
+                text_embeddings[idx]['chunk_embedding'] = self._to_storage(chunk_vec)
+        
+        for idx, context_vec in zip(context_idx, context_vecs):
+            if context_vec is None:
+                failed.add(idx)
+            else:
+                text_embeddings[idx]['context_embedding'] = self._to_storage(context_vec)
+        
+        if failed:
+            text_embeddings = [chunk for idx, chunk in enumerate(text_embeddings) if idx not in failed]
         
         logger.info(f"Completed generating embeddings for {len(text_embeddings)} text chunks")
         return text_embeddings
     
-    async def generate_image_embeddings(self, enriched_image_chunks):
+    async def generate_image_embeddings(self, enriched_image_chunks, copy=False):
         """
         Generate embeddings for image chunks.
         
+        The chunk dictionaries are updated in place with 'chunk_embedding' and
+        'context_embedding' unless copy=True.
+        
         Args:
-            enriched_image_chunks: List of enriched image chunks
+            enriched_image_chunks: List of enriched image chunks, each with an image path
+                in 'chunk' or the encoded image bytes (bytes or bytearray) in 'chunk_bytes'
+            copy: Work on shallow copies instead of mutating the input chunks
             
         Returns:
             List of dictionaries with image chunks and their separate embeddings
         """
-        if self.model is None:
-            await self.load_model()
-            
         logger.info(f"Generating embeddings for {len(enriched_image_chunks)} image chunks")
-        logger.info("Storing separate embeddings for image content and description")
+        logger.debug("Storing separate embeddings for image content and description")
         
         image_embeddings = []
+        image_sources = []
+        descriptions = []
+        description_idx = []
+        chunk_numbers = []
+        existing_paths = self._existing_paths(
+            chunk.get('chunk', '') for chunk in enriched_image_chunks if not chunk.get('chunk_bytes')
+        )
         
         for i, chunk in enumerate(enriched_image_chunks):
-            try:
-                # Extract image path and metadata
-                image_path = chunk.get('chunk', '')
-                metadata = chunk.get('metadata', {})
-                detailed_analysis = metadata.get('detailed_analysis', {})
-                
-                # Extract text description from detailed analysis
-                description = ""
-                if isinstance(detailed_analysis, dict):
-                    description = detailed_analysis.get('detailed_description', '')
-                    if not description and 'key_elements' in detailed_analysis:
-                        description = ', '.join(detailed_analysis.get('key_elements', []))
-                    if not description and 'text_content' in detailed_analysis:
-                        description = detailed_analysis.get('text_content', '')
-                
-                # Skip if no image path
-                if not image_path or not os.path.exists(image_path):
-                    logger.warning(f"Skipping image chunk {i+1} - invalid image path: {image_path}")
-                    continue
-                
-                # Load the image
-                image = Image.open(image_path)
-                
-                # Create a temporary file to save the image (required by the model)
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                    temp_image_path = temp_file.name
-                    image.save(temp_image_path)
-                
-                # Get image embedding
-                image_embedding = np.array(self.model.get_image_embedding(temp_image_path))
-                
-                # Create a copy of the chunk and add the image embedding
-                enriched_chunk = chunk.copy()
-                enriched_chunk['chunk_embedding'] = image_embedding.tolist()
-                
-                # Get text embedding for the description if available
-                if description:
-                    text_embedding = np.array(self.model.get_query_embedding(description))
-                    enriched_chunk['context_embedding'] = text_embedding.tolist()
-                else:
-                    enriched_chunk['context_embedding'] = None
-                
-                image_embeddings.append(enriched_chunk)
-                
-                # Clean up temporary file
-                os.unlink(temp_image_path)
-                
-                if (i + 1) % 5 == 0:
-                    logger.info(f"Processed {i+1}/{len(enriched_image_chunks)} image chunks")
-                
-            except Exception as e:
-                logger.error(f"Error generating embedding for image chunk {i+1}: {e}")
+            # Extract image data (in-memory bytes or a file path) and metadata
+            image_bytes = chunk.get('chunk_bytes')
+            image_path = chunk.get('chunk', '')
+            metadata = chunk.get('metadata', {})
+            detailed_analysis = metadata.get('detailed_analysis', {})
+            
+            # Extract text description from detailed analysis
+            description = ""
+            if isinstance(detailed_analysis, dict):
+                description = detailed_analysis.get('detailed_description', '')
+                if not description and 'key_elements' in detailed_analysis:
+                    description = ', '.join(detailed_analysis.get('key_elements', []))
+                if not description and 'text_content' in detailed_analysis:
+                    description = detailed_analysis.get('text_content', '')
+            
+            # Skip if there is neither image data nor a valid image path
+            if image_bytes:
+                image_source = io.BytesIO(image_bytes)
+            elif image_path and image_path in existing_paths:
+                image_source = image_path
+            else:
+                logger.warning(f"Skipping image chunk {i+1} - invalid image path: {image_path}")
+                continue
+            
+            # Embeddings are filled in after the batched calls
+            enriched_chunk = chunk.copy() if copy else chunk
+            enriched_chunk['context_embedding'] = None
+            image_embeddings.append(enriched_chunk)
+            image_sources.append(image_source)
+            chunk_numbers.append(i + 1)
+            
+            # Only embed the description if available
+            if description:
+                description_idx.append(len(image_embeddings) - 1)
+                descriptions.append(description)
+        
+        # Images and their descriptions each go through the model in EMBED_BATCH_SIZE batches
+        try:
+            image_vecs = await self._embed_image_batch(image_sources)
+        except Exception as e:
+            logger.error(f"Error generating embeddings for image chunks, retrying one by one: {e}")
+            image_vecs = await self._embed_each(
+                self._embed_image_batch, image_sources, [f"image chunk {n}" for n in chunk_numbers]
+            )
+        
+        try:
+            description_vecs = await self._embed_text_batch(descriptions)
+        except Exception as e:
+            logger.error(f"Error generating embeddings for image descriptions, retrying one by one: {e}")
+            description_vecs = await self._embed_each(
+                self._embed_text_batch, descriptions,
+                [f"description of image chunk {chunk_numbers[idx]}" for idx in description_idx]
+            )
+        
+        # A chunk whose image or description failed is skipped, as a whole
+        failed = set()
+        for idx, image_vec in enumerate(image_vecs):
+            if image_vec is None:
+                failed.add(idx)
+            else:
+                image_embeddings[idx]['chunk_embedding'] = self._to_storage(image_vec)
+        
+        for idx, description_vec in zip(description_idx, description_vecs):
+            if description_vec is None:
+                failed.add(idx)
+            else:
+                image_embeddings[idx]['context_embedding'] = self._to_storage(description_vec)
+        
+        if failed:
+            image_embeddings = [chunk for idx, chunk in enumerate(image_embeddings) if idx not in failed]
+        
+        # Raw bytes are not kept in the output; chunks that failed keep theirs
+        for enriched_chunk in image_embeddings:
+            enriched_chunk.pop('chunk_bytes', None)
         
         logger.info(f"Completed generating embeddings for {len(image_embeddings)} image chunks")
         return image_embeddings
     
+    @staticmethod
+    def _existing_paths(paths):
+        """
+        Return the subset of paths that exist as files.
+        
+        Each parent directory is listed once with os.scandir instead of
+        stat-ing every path, and repeated paths are only checked once.
+        """
+        by_dir = {}
+        for path in paths:
+            if path:
+                by_dir.setdefault(os.path.dirname(path) or '.', set()).add(path)
+        
+        existing = set()
+        for directory, dir_paths in by_dir.items():
+            try:
+                with os.scandir(directory) as entries:
+                    names = {entry.name for entry in entries if entry.is_file()}
+            except OSError:
+                continue
+            existing.update(path for path in dir_paths if os.path.basename(path) in names)
+        return existing
+    
     def _standardize_embedding_keys(self, embeddings, embedding_type=None):
         """
-        Standardize the keys in the embeddings to ensure consistency.
+        Standardize the keys in the embeddings in place to ensure consistency.
         
         Args:
-            embeddings: List of embedding dictionaries
+            embeddings: List of embedding dictionaries (modified in place)
             embedding_type: Optional type to enforce (text or image)
             
         Returns:
-            List of standardized embedding dictionaries
+            The same list, with standardized embedding dictionaries
         """
-        standardized_embeddings = []
-        
         for item in embeddings:
-            standardized_item = item.copy()
-            
             # Rename 'chunk' to 'content' for consistency
-            if 'chunk' in standardized_item:
-                standardized_item['content'] = standardized_item.pop('chunk')
+            if 'chunk' in item:
+                item['content'] = item.pop('chunk')
             
             # For image embeddings, rename detailed_analysis to context
-            if item.get('chunk_type') == 'image' and 'metadata' in standardized_item:
-                metadata = standardized_item['metadata']
+            if item.get('chunk_type') == 'image' and 'metadata' in item:
+                metadata = item['metadata']
                 if isinstance(metadata, dict) and 'detailed_analysis' in metadata:
                     metadata['context'] = metadata.pop('detailed_analysis')
             
             # Ensure chunk_type is set
-            if embedding_type == 'text' and 'chunk_type' not in standardized_item:
-                standardized_item['chunk_type'] = 'text'
-            elif embedding_type == 'image' and 'chunk_type' not in standardized_item:
-                standardized_item['chunk_type'] = 'image'
+            if embedding_type and 'chunk_type' not in item:
+                item['chunk_type'] = embedding_type
+        
+        return embeddings
+
+    @staticmethod
+    def to_columnar(embeddings, dtype=np.float16):
+        """
+        Convert a list of embedding dicts into a struct-of-arrays layout.
+        
+        Args:
+            embeddings: List of embedding dictionaries (as in "all_embeddings")
+            dtype: NumPy dtype for the vector matrices
             
-            standardized_embeddings.append(standardized_item)
+        Returns:
+            Dictionary with "chunk_vectors" (N x D), "context_vectors" (N x D, NaN rows
+            where there is no context embedding), "chunk_ids", "chunk_types" and a
+            parallel "metadata" list of the remaining fields
+        """
+        if not embeddings:
+            return {
+                "chunk_vectors": np.empty((0, 0), dtype=dtype),
+                "context_vectors": np.empty((0, 0), dtype=dtype),
+                "chunk_ids": np.empty(0, dtype=str),
+                "chunk_types": np.empty(0, dtype=str),
+                "metadata": []
+            }
+        
+        chunk_vectors = np.stack([np.asarray(item['chunk_embedding'], dtype=dtype) for item in embeddings])
+        context_vectors = np.full(chunk_vectors.shape, np.nan, dtype=dtype)
+        for i, item in enumerate(embeddings):
+            if item.get('context_embedding') is not None:
+                context_vectors[i] = item['context_embedding']
         
-        return standardized_embeddings
+        vector_keys = ('chunk_embedding', 'context_embedding')
+        return {
+            "chunk_vectors": chunk_vectors,
+            "context_vectors": context_vectors,
+            "chunk_ids": np.array([str(item.get('chunk_id', '')) for item in embeddings]),
+            "chunk_types": np.array([item.get('chunk_type', '') for item in embeddings]),
+            "metadata": [{k: v for k, v in item.items() if k not in vector_keys} for item in embeddings]
+        }
 
-    async def generate_embeddings(self, enriched_content, output_path):
+    async def generate_embeddings(self, enriched_content, output_path, columnar=False):
         """
         Generate embeddings for all content (text and images).
         
         Args:
             enriched_content: List of enriched content chunks
             output_path: Path to save the embeddings
+            columnar: Return a struct-of-arrays layout (see to_columnar) instead of
+                per-chunk dictionaries; useful for in-process similarity math
             
         Returns:
             Dictionary with embeddings (but doesn't save them to disk)
         """
-        if self.model is None:
-            await self.load_model()
-        
         # Separate text and image chunks
         text_chunks = [chunk for chunk in enriched_content if chunk.get('chunk_type', '') == 'text']
         image_chunks = [chunk for chunk in enriched_content if chunk.get('chunk_type', '') == 'image']
         
         # Log the actual counts to verify
         logger.info(f"Processing {len(text_chunks)} text chunks and {len(image_chunks)} image chunks")
-        logger.info(f"Text chunk IDs: {[chunk.get('chunk_id') for chunk in text_chunks]}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Text chunk IDs: %s", [chunk.get('chunk_id') for chunk in text_chunks])
         
-        # Generate embeddings
-        text_embeddings = await self.generate_text_embeddings(text_chunks)
-        image_embeddings = await self.generate_image_embeddings(image_chunks)
+        # Generate embeddings; text and image preprocessing overlap, model calls are serialized
+        text_embeddings, image_embeddings = await asyncio.gather(
+            self.generate_text_embeddings(text_chunks),
+            self.generate_image_embeddings(image_chunks),
+        )
         
-        # Standardize keys in embeddings
-        logger.info("Standardizing embedding keys for consistency")
-        text_embeddings = self._standardize_embedding_keys(text_embeddings, 'text')
-        image_embeddings = self._standardize_embedding_keys(image_embeddings, 'image')
-        
-        # Combine embeddings for the full dataset
-        all_embeddings = text_embeddings + image_embeddings
-        all_embeddings = self._standardize_embedding_keys(all_embeddings)
-        
-        # Sort by chunk_id
+        # Combine, standardize keys and sort once; per-type lists are derived from the sorted list
+        logger.debug("Standardizing embedding keys for consistency")
+        all_embeddings = self._standardize_embedding_keys(text_embeddings + image_embeddings)
         all_embeddings.sort(key=lambda x: float(x.get('chunk_id', 0)))
-        text_embeddings.sort(key=lambda x: float(x.get('chunk_id', 0)))
-        image_embeddings.sort(key=lambda x: float(x.get('chunk_id', 0)))
+        text_embeddings = [item for item in all_embeddings if item.get('chunk_type') == 'text']
+        image_embeddings = [item for item in all_embeddings if item.get('chunk_type') == 'image']
         
         # Return the embeddings without saving them
         logger.info(f"Generated embeddings for {len(all_embeddings)} content items")
-        logger.info(f"All embeddings keys: {all_embeddings[0].keys()}")
+        if all_embeddings:
+            logger.debug("All embeddings keys: %s", all_embeddings[0].keys())
+        if columnar:
+            columns = self.to_columnar(all_embeddings)
+            columns["output_path"] = output_path
+            return columns
+        
         # Return just the embeddings and output_path
         return {
             "all_embeddings": all_embeddings,
@@ -281,24 +603,79 @@ class EmbeddingGenerator:
         Returns:
             Dictionary containing the embedding vector
         """
-        if self.model is None:
-            await self.load_model()
-            
-        logger.info(f"Generating embedding for text of length {len(text)}")
+        logger.debug("Generating embedding for text of length %d", len(text))
         
         try:
-            # Generate the embedding
-            embedding = np.array(self.model.get_query_embedding(text))
+            # Generate the embedding; concurrent callers share one forward pass
+            embedding = await self._submit_query(text)
             
             # Return as a dictionary
             result = {
                 "text": text[:100] + "..." if len(text) > 100 else text,  # Truncate for logging
-                "embedding": embedding.tolist()
+                "embedding": embedding
             }
             
-            logger.info(f"Successfully generated embedding with {embedding.shape[0]} dimensions")
+            logger.debug("Successfully generated embedding with %d dimensions", len(embedding))
             return result
             
         except Exception as e:
             logger.error(f"Error generating embedding for text: {e}")
-            raise RuntimeError(f"Failed to generate embedding: {e}") 
\ No newline at end of file
+            raise RuntimeError(f"Failed to generate embedding: {e}")
+
+
+def ingest_to_weaviate(all_embeddings, collection_name=None, client=None, batch_size=200, concurrent_requests=4):
+    """
+    Write generated embeddings to Weaviate with the v4 gRPC batch API.
+    
+    Each item becomes one object with named vectors "content_embedding" and
+    "context_embedding" (the names the search service queries), sent in batches
+    rather than one request per object.
+    
+    Args:
+        all_embeddings: List of embedding dictionaries (as in "all_embeddings")
+        collection_name: Target collection (defaults to COLLECTION_NAME env var, or "ret_shp")
+        client: Connected weaviate.WeaviateClient; a local connection is opened if omitted
+        batch_size: Objects per batch request
+        concurrent_requests: Batch requests in flight at once
+        
+    Returns:
+        Number of objects that failed to import
+    """
+    import weaviate
+    
+    collection_name = collection_name or os.getenv("COLLECTION_NAME", "ret_shp")
+    owns_client = client is None
+    if owns_client:
+        client = weaviate.connect_to_local()
+    
+    try:
+        collection = client.collections.get(collection_name)
+        logger.info(f"Ingesting {len(all_embeddings)} embeddings into Weaviate collection {collection_name}")
+        
+        with collection.batch.fixed_size(batch_size=batch_size, concurrent_requests=concurrent_requests) as batch:
+            for item in all_embeddings:
+                metadata = item.get('metadata', {})
+                properties = {
+                    "chunk_id": str(item.get('chunk_id', '')),
+                    "chunk_type": item.get('chunk_type', ''),
+                    "category": metadata.get('category', ''),
+                    "subcategory": metadata.get('subcategory', ''),
+                    "metadata": json.dumps(metadata, default=str),
+                }
+                
+                vectors = {"content_embedding": np.asarray(item['chunk_embedding'], dtype=np.float32).tolist()}
+                if item.get('context_embedding') is not None:
+                    vectors["context_embedding"] = np.asarray(item['context_embedding'], dtype=np.float32).tolist()
+                
+                batch.add_object(properties=properties, vector=vectors)
+        
+        failed_objects = collection.batch.failed_objects
+        if failed_objects:
+            logger.warning(f"Failed to import {len(failed_objects)} objects into {collection_name}")
+        else:
+            logger.info(f"Successfully imported {len(all_embeddings)} objects into {collection_name}")
+        return len(failed_objects)
+    
+    finally:
+        if owns_client:
+            client.close()
@@ -2,10 +2,17 @@ import os
 import json
 import base64
 import asyncio
+import hashlib
 import tempfile
-from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, HTTPException, Request
-from pydantic import BaseModel, Field
+import concurrent.futures
+import orjson
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Literal
+from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict, with_config
+from typing_extensions import TypedDict, NotRequired
 from embedding_generator import EmbeddingGenerator
 from fastapi import UploadFile, File
 
@@ -13,28 +20,81 @@ import sys
 sys.path.append('../')
 from logger_config import logger
 
+# SIMD-accelerated base64 decoding when pybase64 is installed. It returns bytes,
+# which io.BytesIO shares without copying (a bytearray would be copied)
+try:
+    import pybase64
+    _b64decode_simd = pybase64.b64decode
+except ImportError:
+    pybase64 = None
+    _b64decode_simd = base64.b64decode
+
+# Below this size the SIMD dispatch overhead outweighs the gain
+_SMALL_B64_LEN = 64
+
+def _b64decode(base64_string):
+    if len(base64_string) < _SMALL_B64_LEN:
+        return base64.b64decode(base64_string)
+    return _b64decode_simd(base64_string, validate=False)
+
+# Worker threads for blocking decode work, so it does not stall the event loop
+_CPU_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="decode")
+_MAX_CONCURRENT_DECODES = 16
+
+# Upload limits for /embed-image
+_MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # 10 MB
+_UPLOAD_CHUNK_SIZE = 64 * 1024
+_ALLOWED_EXT = frozenset({'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp'})
+_ALLOWED_EXT_ERR = ", ".join(sorted(_ALLOWED_EXT))
+
+# Optional LRU cache of text embeddings (EMBED_CACHE=1), keyed by a BLAKE2 digest of the text
+_EMB_CACHE_ENABLED = os.getenv("EMBED_CACHE", "0") == "1"
+_EMB_CACHE_MAX = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+_EMB_CACHE: "OrderedDict[bytes, Any]" = OrderedDict()
+
+# Resolved once; tempfile.gettempdir() re-checks its cache on every call
+_TMPDIR = tempfile.gettempdir()
+
+# Optional gRPC endpoint sharing the same model (EMBED_GRPC_PORT, e.g. 6007)
+_GRPC_PORT = os.getenv("EMBED_GRPC_PORT")
+grpc_server = None
+
+class NumpyORJSONResponse(ORJSONResponse):
+    """
+    ORJSONResponse that serializes NumPy arrays natively instead of via tolist().
+    """
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
 # Initialize FastAPI app
 app = FastAPI(title="Embedding Generation Service")
 
-# Initialize the embedding generator
-embedding_generator = EmbeddingGenerator()
+# Initialize the embedding generator (the model is loaded once in startup_event)
+embedding_generator = EmbeddingGenerator(preload=False)
 
-class ContentItem(BaseModel):
+# Request payloads are validated straight into plain dicts (TypedDicts), so the
+# per-item processing below works on them without a model -> dict round-trip.
+# Unknown keys are kept and passed through to the generator.
+@with_config(ConfigDict(extra="allow"))
+class ContentItem(TypedDict):
     chunk_id: str
     chunk_type: str
-    metadata: Dict[str, Any] = Field(default_factory=dict)
-    embedding_content_texts: str = None
-    generated_context: str = None
-    image_base64: str = None
-    image_format: str = None
+    metadata: NotRequired[Dict[str, Any]]
+    embedding_content_texts: NotRequired[Optional[str]]
+    generated_context: NotRequired[Optional[str]]
+    image_base64: NotRequired[Optional[str]]
+    image_format: NotRequired[Optional[str]]
 
-class EmbeddingRequest(BaseModel):
+class EmbeddingRequest(TypedDict):
     content: List[ContentItem]
     output_path: str
     job_id: str
 
+Quantization = Literal["fp32", "fp16", "int8"]
+
 class TextEmbeddingRequest(BaseModel):
     text: str
+    quantize: Quantization = "fp32"
 
 class ImageEmbeddingRequest(BaseModel):
     image_path: str
@@ -49,59 +109,94 @@ def validate_uploaded_file(file: UploadFile) -> None:
     Raises:
         HTTPException: If file validation fails
     """
+    filename = file.filename
+    content_type = file.content_type
+    
     # Check if filename exists and is valid
-    if not file.filename:
+    if not filename:
         logger.error("No filename provided")
         raise HTTPException(status_code=400, detail="No filename provided")
     
-    if file.filename == "":
+    if filename == "":
         logger.error("Empty filename")
         raise HTTPException(status_code=400, detail="Empty filename")
     
     # Check file extension
-    allowed_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp'}
-    file_extension = os.path.splitext(file.filename)[1].lower()
+    file_extension = os.path.splitext(filename)[1].lower()
     
-    if file_extension not in allowed_extensions:
+    if file_extension not in _ALLOWED_EXT:
         logger.error(f"Unsupported file extension: {file_extension}")
         raise HTTPException(
             status_code=400, 
-            detail=f"Unsupported file type: {file_extension}. Allowed: {', '.join(allowed_extensions)}"
+            detail=f"Unsupported file type: {file_extension}. Allowed: {_ALLOWED_EXT_ERR}"
         )
     
     # Check content type if available (with None check)
-    if file.content_type is not None:  # Fix for the startswith error
-        if not file.content_type.startswith("image/"):
-            logger.error(f"Invalid content type: {file.content_type}")
+    if content_type is not None:  # Fix for the startswith error
+        if not content_type.startswith("image/"):
+            logger.error(f"Invalid content type: {content_type}")
             raise HTTPException(
                 status_code=400, 
-                detail=f"Invalid content type: {file.content_type}. Expected image/*"
+                detail=f"Invalid content type: {content_type}. Expected image/*"
             )
     else:
         logger.warning("No content type provided, relying on file extension validation")
     
-    logger.info(f"File validation passed for: {file.filename}")
+    logger.debug("File validation passed for: %s", filename)
+
+def wants_bytes(request: Request, output_format: str, quantize: str = "fp32") -> bool:
+    """
+    Whether the client asked for a raw binary embedding (?format=bytes, Accept
+    header, or a quantized output, which is only offered as bytes).
+    """
+    return (
+        output_format == "bytes"
+        or quantize != "fp32"
+        or request.headers.get("accept") == "application/octet-stream"
+    )
+
+def embedding_bytes_response(embedding, quantize: str = "fp32") -> Response:
+    """
+    Return an embedding as a raw little-endian buffer.
+    
+    fp32 takes 4 bytes per dimension instead of ~18 for a JSON float, fp16 takes 2
+    and int8 takes 1. The client rebuilds it with np.frombuffer(body, dtype=X-Dtype);
+    int8 values are multiplied by the X-Scale header to recover the floats.
+    """
+    vector = np.asarray(embedding, dtype="<f4")
+    headers = {"X-Dim": str(vector.size)}
+    
+    if quantize == "fp16":
+        payload = vector.astype("<f2").tobytes()
+        headers["X-Dtype"] = "float16"
+    elif quantize == "int8":
+        scale = float(np.abs(vector).max()) / 127.0 if vector.size else 0.0
+        quantized = np.round(vector / scale) if scale else np.zeros_like(vector)
+        payload = quantized.astype(np.int8).tobytes()
+        headers["X-Dtype"] = "int8"
+        headers["X-Scale"] = repr(scale)
+    else:
+        payload = vector.tobytes()
+        headers["X-Dtype"] = "float32"
+    
+    return Response(content=payload, media_type="application/octet-stream", headers=headers)
 
 @app.post("/generate-embeddings")
-async def generate_embeddings(request: Request):
+async def generate_embeddings(request: EmbeddingRequest):
     """
     API endpoint to receive content and generate embeddings.
     
     The endpoint receives content items (text or images), processes them,
     generates embeddings, and returns the embeddings along with job_id and output_path.
+    The body is validated by FastAPI against EmbeddingRequest (422 on mismatch).
     """
     try:
-        # Parse the request body
-        request_data = await request.json()
-        
         # Log request information
-        job_id = request_data.get("job_id", "unknown")
-        content_items = request_data.get("content", [])
-        output_path = request_data.get("output_path", "")
+        job_id = request["job_id"]
+        content_items = request["content"]
+        output_path = request["output_path"]
 
-        logger.info(f"Received embedding generation request for job {job_id} with {len(content_items)} items")
-        if content_items:
-            logger.info(f"Content items keys: {content_items[0].keys()}")
+        logger.info("Received embedding generation request for job %s with %d items", job_id, len(content_items))
 
         # Process the content items
         processed_content = await process_content_items(content_items)
@@ -112,18 +207,18 @@ async def generate_embeddings(request: Request):
         # Add job_id to the response
         embedding_results["job_id"] = job_id
         
-        # Clean up temporary image files
-        await cleanup_temp_files(processed_content)
-        
-        return embedding_results
+        return NumpyORJSONResponse(embedding_results)
         
     except Exception as e:
         logger.error(f"Error processing embedding request: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing embedding request: {str(e)}")
 
-async def process_content_items(content_items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+async def process_content_items(content_items: List[ContentItem]) -> List[Dict[str, Any]]:
     """
-    Process content items, converting base64 images to temporary files.
+    Process content items, decoding base64 images to in-memory bytes.
+    
+    Items are processed concurrently (at most _MAX_CONCURRENT_DECODES decodes
+    in flight) and returned in request order.
     
     Args:
         content_items: List of content items from the request
@@ -131,77 +226,67 @@ async def process_content_items(content_items: List[Dict[str, Any]]) -> List[Dic
     Returns:
         List of processed content items ready for embedding generation
     """
-    processed_items = []
+    loop = asyncio.get_running_loop()
+    decode_slots = asyncio.Semaphore(_MAX_CONCURRENT_DECODES)
     
-    for item in content_items:
-        try:
-            processed_item = item.copy()
-            
-            # Process based on chunk type
-            if item.get("chunk_type") == "image" and item.get("image_base64"):
-                # Convert base64 to image file
-                temp_image_path = await base64_to_image(
-                    item["image_base64"], 
-                    item.get("image_format", "png")
+    async def process_one(item):
+        processed_item = item.copy()
+        chunk_type = item.get("chunk_type")
+        chunk_id = item.get("chunk_id")
+        
+        # Process based on chunk type
+        if chunk_type == "image" and item.get("image_base64"):
+            # Decode base64 straight to bytes in the worker pool; the embedder reads them from memory
+            async with decode_slots:
+                processed_item["chunk_bytes"] = await loop.run_in_executor(
+                    _CPU_POOL, _b64decode, item["image_base64"]
                 )
-                
-                # Update the item with the temporary image path
-                processed_item["chunk"] = temp_image_path
-                
-                # Remove the base64 data to save memory
-                if "image_base64" in processed_item:
-                    del processed_item["image_base64"]
-                
-                logger.info(f"Processed image chunk {item.get('chunk_id')}, saved to temporary file")
-                
-            elif item.get("chunk_type") == "text":
-                # For text chunks, ensure the content is in the expected format
-                if "embedding_content_texts" in item:
-                    processed_item["chunk"] = item["embedding_content_texts"]
-                
-                logger.info(f"Processed text chunk {item.get('chunk_id')}")
             
-            processed_items.append(processed_item)
+            # Remove the base64 data to save memory
+            del processed_item["image_base64"]
+            
+            logger.debug("Processed image chunk %s, decoded to memory", chunk_id)
             
-        except Exception as e:
-            logger.error(f"Error processing content item {item.get('chunk_id')}: {str(e)}")
+        elif chunk_type == "text":
+            # For text chunks, ensure the content is in the expected format
+            if "embedding_content_texts" in item:
+                processed_item["chunk"] = item["embedding_content_texts"]
+            
+            logger.debug("Processed text chunk %s", chunk_id)
+        
+        return processed_item
+    
+    results = await asyncio.gather(*(process_one(item) for item in content_items), return_exceptions=True)
+    
+    processed_items = []
+    for item, result in zip(content_items, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error processing content item {item.get('chunk_id')}: {str(result)}")
             # Continue with other items even if one fails
+            continue
+        processed_items.append(result)
     
-    logger.info(f"Processed {len(processed_items)} content items")
+    logger.debug("Processed %d content items", len(processed_items))
     return processed_items
 
-async def base64_to_image(base64_string: str, image_format: str) -> str:
+async def embed_text_cached(text: str) -> Dict[str, Any]:
     """
-    Convert a base64 string to an image file.
-    
-    Args:
-        base64_string: Base64 encoded image data
-        image_format: Format of the image (jpg, png, etc.)
-        
-    Returns:
-        Path to the temporary image file
+    Generate a text embedding, reusing a cached one for repeated texts when EMBED_CACHE=1.
     """
-    try:
-        # Decode the base64 string
-        image_data = base64.b64decode(base64_string)
-        
-        # Create a temporary file with the appropriate extension
-        suffix = f".{image_format}" if image_format else ".png"
-        
-        # Create a temporary file that won't be automatically deleted
-        temp_file = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
-        temp_file_path = temp_file.name
-        
-        # Write the image data to the file
-        with open(temp_file_path, "wb") as f:
-            f.write(image_data)
-        
-        logger.info(f"Converted base64 image to temporary file: {temp_file_path}")
-        return temp_file_path
-        
-    except Exception as e:
-        logger.error(f"Error converting base64 to image: {str(e)}")
-        raise
+    if not _EMB_CACHE_ENABLED:
+        return await embedding_generator.generate_embedding_for_text(text)
+    
+    key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+    result = _EMB_CACHE.get(key)
+    if result is not None:
+        _EMB_CACHE.move_to_end(key)
+        return result
+    
+    result = await embedding_generator.generate_embedding_for_text(text)
+    _EMB_CACHE[key] = result
+    if len(_EMB_CACHE) > _EMB_CACHE_MAX:
+        _EMB_CACHE.popitem(last=False)
+    return result
 
 # Startup event to load the embedding model
 @app.on_event("startup")
@@ -209,67 +294,75 @@ async def startup_event():
     logger.info("Starting embedding service and loading model...")
     await embedding_generator.load_model()
     logger.info("Embedding service started and model loaded")
+    
+    if _GRPC_PORT:
+        global grpc_server
+        from grpc_service import build_grpc_server
+        grpc_server = build_grpc_server(embedding_generator, int(_GRPC_PORT))
+        await grpc_server.start()
+        logger.info(f"gRPC embedding service listening on port {_GRPC_PORT}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if grpc_server is not None:
+        await grpc_server.stop(grace=5)
 
 @app.get("/health")
 async def health():
     return {"status": "ok", "service": "embedding_generation"}
 
 @app.post("/embed-image")
-async def embed_image(file: UploadFile = File(...)):
+async def embed_image(
+    http_request: Request,
+    file: UploadFile = File(...),
+    output_format: str = Query("json", alias="format"),
+    quantize: Quantization = Query("fp32")
+):
     """
     Generate embedding for an uploaded image file.
+    
+    Pass ?format=bytes (or Accept: application/octet-stream) to get the raw
+    float32 vector instead of a JSON list, or ?quantize=fp16|int8 for a
+    smaller quantized buffer.
     """
-    temp_file_path = None
     try:
-        logger.info("=== Image Embedding Request ===")
-        logger.info(f"Filename: {file.filename}")
-        logger.info(f"Content type: {file.content_type}")
-        logger.info(f"Size: {file.size if hasattr(file, 'size') else 'unknown'}")
+        logger.debug("Image embedding request: filename=%s content_type=%s", file.filename, file.content_type)
         
         # Validate the uploaded file
         validate_uploaded_file(file)
         
-        # Read content and check size
-        content = await file.read()
+        # Read content in chunks, enforcing the size limit as we go
+        buffer = bytearray()
+        while chunk := await file.read(_UPLOAD_CHUNK_SIZE):
+            buffer += chunk
+            if len(buffer) > _MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail="File too large (max 10MB)")
         
-        if not content:
+        if not buffer:
             raise HTTPException(status_code=400, detail="Empty file content")
         
-        if len(content) > 10 * 1024 * 1024:  # 10 MB limit
-            raise HTTPException(status_code=413, detail="File too large (max 10MB)")
+        content = bytes(buffer)
+        del buffer
         
-        logger.info(f"File size: {len(content)} bytes")
+        logger.debug("File size: %d bytes", len(content))
         
-        # Create temporary file
-        suffix = os.path.splitext(file.filename)[1] or ".png"
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-        temp_file_path = temp_file.name
-        
-        # Write content to temporary file
-        with open(temp_file_path, "wb") as f:
-            f.write(content)
-
-        logger.info(f"Received image file {file.filename}, saved to {temp_file_path}")
-
-        # Generate the embedding
-        image_embedding = await embedding_generator.generate_image_embedding(temp_file_path)
+        # Generate the embedding directly from the uploaded bytes
+        image_embedding = await embedding_generator.generate_image_embedding_from_bytes(content)
         
         if image_embedding is None:
             raise HTTPException(status_code=500, detail="Failed to generate embedding")
         
-        # Convert numpy array to list if needed
-        if hasattr(image_embedding, 'tolist'):
-            embedding_list = image_embedding.tolist()
-        else:
-            embedding_list = image_embedding
-
-        logger.info(f"Successfully generated embedding with {len(embedding_list)} dimensions")
+        if wants_bytes(http_request, output_format, quantize):
+            return embedding_bytes_response(image_embedding, quantize)
+        
+        logger.debug("Successfully generated embedding with %d dimensions", len(image_embedding))
 
-        return {
-            "embedding": embedding_list,
-            "dimensions": len(embedding_list),
+        # NumPy arrays are written directly by orjson, no tolist() needed
+        return NumpyORJSONResponse({
+            "embedding": image_embedding,
+            "dimensions": len(image_embedding),
             "filename": file.filename
-        }
+        })
 
     except HTTPException:
         # Re-raise HTTP exceptions as-is
@@ -277,40 +370,41 @@ async def embed_image(file: UploadFile = File(...)):
     except Exception as e:
         logger.error(f"Error generating image embedding: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate image embedding: {str(e)}")
-    finally:
-        # Clean up temporary file
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                logger.info(f"Cleaned up temporary file: {temp_file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to remove temporary file {temp_file_path}: {e}")
 
 @app.post("/generate-text-embedding")
-async def generate_text_embedding(request: TextEmbeddingRequest):
+async def generate_text_embedding(
+    request: TextEmbeddingRequest,
+    http_request: Request,
+    output_format: str = Query("json", alias="format")
+):
     """
     Generate an embedding for a single text string.
     
     This endpoint allows users to get embeddings for arbitrary text
     without going through the full document processing pipeline.
+    Pass ?format=bytes (or Accept: application/octet-stream) to get the raw
+    float32 vector instead of a JSON list, or set "quantize" to "fp16"/"int8"
+    for a smaller quantized buffer.
     """
     try:
-        logger.info(f"=== Text Embedding Request ===")
-        logger.info(f"Text length: {len(request.text)}")
+        logger.debug("Text embedding request: text length %d", len(request.text))
         
         if not request.text or not request.text.strip():
             raise HTTPException(status_code=400, detail="Empty text provided")
         
-        # Use the already initialized embedding_generator
-        result = await embedding_generator.generate_embedding_for_text(request.text)
+        # Use the already initialized embedding_generator (through the optional cache)
+        result = await embed_text_cached(request.text)
         
-        logger.info(f"Successfully generated text embedding")
+        logger.debug("Successfully generated text embedding")
         
-        return {
+        if wants_bytes(http_request, output_format, request.quantize):
+            return embedding_bytes_response(result["embedding"], request.quantize)
+        
+        return NumpyORJSONResponse({
             "embedding": result["embedding"],
             "dimensions": len(result["embedding"]),
             "text_length": len(request.text)
-        }
+        })
         
     except HTTPException:
         raise
@@ -318,21 +412,6 @@ async def generate_text_embedding(request: TextEmbeddingRequest):
         logger.error(f"Error generating text embedding: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def cleanup_temp_files(processed_content):
-    """
-    Clean up temporary files created during processing.
-    """
-    for item in processed_content:
-        if (item.get("chunk_type") == "image" and 
-            item.get("chunk") and 
-            isinstance(item.get("chunk"), str) and
-            item.get("chunk").startswith(tempfile.gettempdir())):
-            try:
-                os.remove(item["chunk"])
-                logger.info(f"Removed temporary file: {item['chunk']}")
-            except Exception as e:
-                logger.warning(f"Failed to remove temporary file {item['chunk']}: {e}")
-
 # Error handlers
 @app.exception_handler(ValueError)
 async def value_error_handler(request: Request, exc: ValueError):
@@ -350,17 +429,32 @@ async def debug_info():
     """Debug endpoint to check service status"""
     return {
         "model_loaded": embedding_generator.model is not None,
-        "temp_dir": tempfile.gettempdir(),
+        "temp_dir": _TMPDIR,
         "python_version": sys.version,
         "endpoints": [
             "/health",
             "/embed-image", 
             "/generate-text-embedding",
             "/generate-embeddings"
-        ]
+        ],
+        "binary_output": {
+            "request": "?format=bytes, Accept: application/octet-stream, or quantize=fp16|int8",
+            "headers": ["X-Dim", "X-Dtype", "X-Scale (int8 only; value = int8 * scale)"]
+        }
     }
 
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting FastAPI embedding service...")
-    uvicorn.run(app, host="0.0.0.0", port=6006, log_level="info")
\ No newline at end of file
+    # Each worker is a separate process with its own copy of the model; keep
+    # EMBED_WORKERS at 1 unless the GPU has room for several copies.
+    workers = int(os.getenv("EMBED_WORKERS", "1"))
+    uvicorn.run(
+        "embedding_service:app",
+        host="0.0.0.0",
+        port=6006,
+        workers=workers,
+        loop="auto",  # uvloop when installed
+        http="auto",  # httptools when installed
+        log_level="info"
+    )
\ No newline at end of file
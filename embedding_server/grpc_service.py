@@ -0,0 +1,65 @@
+import numpy as np
+import grpc
+
+import sys
+sys.path.append('../')
+from logger_config import logger
+
+# Unary methods of the "embedding.Embedding" service. Payloads are raw bytes, so no
+# protobuf stubs are needed:
+#   EmbedText  - request: UTF-8 text,          response: little-endian float32 vector
+#   EmbedImage - request: encoded image bytes, response: little-endian float32 vector
+SERVICE_NAME = "embedding.Embedding"
+
+
+def _identity(data):
+    return data
+
+
+def _to_float32_bytes(embedding) -> bytes:
+    return np.asarray(embedding, dtype="<f4").tobytes()
+
+
+def build_grpc_server(embedding_generator, port: int):
+    """
+    Build a grpc.aio server exposing the embedding generator on the given port.
+
+    It runs on the same event loop as the FastAPI app and shares its model and
+    micro-batchers, so gRPC and HTTP callers are batched together.
+    """
+    async def embed_text(request: bytes, context):
+        text = request.decode("utf-8")
+        if not text.strip():
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Empty text provided")
+        try:
+            result = await embedding_generator.generate_embedding_for_text(text)
+        except Exception as e:
+            logger.error(f"gRPC EmbedText failed: {e}")
+            await context.abort(grpc.StatusCode.INTERNAL, str(e))
+        return _to_float32_bytes(result["embedding"])
+
+    async def embed_image(request: bytes, context):
+        if not request:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Empty image content")
+        try:
+            embedding = await embedding_generator.generate_image_embedding_from_bytes(request)
+        except Exception as e:
+            logger.error(f"gRPC EmbedImage failed: {e}")
+            await context.abort(grpc.StatusCode.INTERNAL, str(e))
+        return _to_float32_bytes(embedding)
+
+    handlers = {
+        "EmbedText": grpc.unary_unary_rpc_method_handler(
+            embed_text, request_deserializer=_identity, response_serializer=_identity
+        ),
+        "EmbedImage": grpc.unary_unary_rpc_method_handler(
+            embed_image, request_deserializer=_identity, response_serializer=_identity
+        ),
+    }
+
+    server = grpc.aio.server(options=[
+        ("grpc.max_receive_message_length", 16 * 1024 * 1024),
+    ])
+    server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(SERVICE_NAME, handlers),))
+    server.add_insecure_port(f"[::]:{port}")
+    return server
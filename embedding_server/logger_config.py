@@ -1,6 +1,8 @@
 import os
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 # Create logs directory if it doesn't exist
 logs_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
@@ -8,7 +10,8 @@ os.makedirs(logs_dir, exist_ok=True)
 
 # Configure logger
 logger = logging.getLogger('embedding_service')
-logger.setLevel(logging.INFO)
+# LOG_LEVEL=DEBUG brings back per-item/per-request logs
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
 
 # Create a formatter
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -16,17 +19,19 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 # Create a file handler for result.log
 log_file = os.path.join(logs_dir, 'result.log')
 file_handler = RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5)  # 10MB per file, keep 5 backups
-file_handler.setLevel(logging.INFO)
 file_handler.setFormatter(formatter)
 
 # Create a console handler
 console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
 console_handler.setFormatter(formatter)
 
-# Add handlers to logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# Log calls only enqueue the record; a background listener thread does the
+# file/console writes (and rotation) off the request path
+log_queue = queue.SimpleQueue()
+logger.addHandler(QueueHandler(log_queue))
+listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
 
 # Prevent log propagation to avoid duplicate logs
 logger.propagate = False
@@ -1,11 +1,22 @@
+import io
+import os
+import re
+import sys
 import json
 import time
-from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
-from datetime import datetime
-import pandas as pd
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple
+import numpy as np
 from shopping_assistant.agent import ProductSearchAgent
 
+@lru_cache(maxsize=1)
+def _shared_agent() -> ProductSearchAgent:
+    """Agent shared by sequential evaluations, built once per process"""
+    return ProductSearchAgent()
+
 @dataclass
 class ConversationTestCase:
     """Single conversation test case"""
@@ -14,7 +25,24 @@ class ConversationTestCase:
     expected_outcomes: Dict[str, Any]
     description: str
 
-@dataclass
+# Whole-word pronouns that need context to resolve ("it" must not match "item")
+_PRONOUN_RE = re.compile(r"\b(?:them|it|those|that)\b", re.IGNORECASE)
+
+# Conversation test cases live next to this module as JSON
+_TEST_CASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_conversations.json")
+
+def _iter_test_cases(path: str = _TEST_CASES_PATH) -> Iterator[ConversationTestCase]:
+    """Yield test cases one at a time, e.g. to feed a large suite through an executor"""
+    with open(path, encoding="utf-8") as f:
+        for case in json.load(f):
+            yield ConversationTestCase(**case)
+
+@lru_cache(maxsize=None)
+def _cached_test_cases(path: str) -> Tuple[ConversationTestCase, ...]:
+    """Test cases parsed once per process"""
+    return tuple(_iter_test_cases(path))
+
+@dataclass(slots=True)
 class EvaluationMetrics:
     """Comprehensive evaluation metrics"""
     # Context Pipeline Metrics
@@ -41,117 +69,60 @@ class EvaluationMetrics:
 class PipelineEvaluator:
     """Comprehensive pipeline evaluation system"""
     
-    def __init__(self):
-        self.agent = ProductSearchAgent()
+    def __init__(self, agent_factory: Optional[Callable[[], ProductSearchAgent]] = None):
+        # Concurrent runs need one agent per conversation (it owns memory and cart);
+        # sequential runs reuse the shared agent and reset it between conversations
+        self.agent_factory = agent_factory or ProductSearchAgent
         self.test_cases = self._load_test_cases()
         self.results = []
         
     def _load_test_cases(self) -> List[ConversationTestCase]:
         """Load comprehensive test cases"""
-        return [
-            # Context Resolution Tests
-            ConversationTestCase(
-                conversation_id="context_001",
-                turns=[
-                    {"user": "red nike t-shirts", "expected_intent": "product_search", 
-                     "expected_entities": {"color": "red", "brand": "nike", "product_type": "t-shirt"}},
-                    {"user": "how many do you have?", "expected_intent": "faq",
-                     "expected_context_resolution": "how many red nike t-shirts do you have?"},
-                    {"user": "average price of them?", "expected_intent": "faq",
-                     "expected_context_resolution": "average price of red nike t-shirts?"}
-                ],
-                expected_outcomes={"context_maintained": True, "pronouns_resolved": True},
-                description="Multi-turn context with pronoun resolution"
-            ),
-            
-            # Multimodal Tests
-            ConversationTestCase(
-                conversation_id="multimodal_001", 
-                turns=[
-                    {"user": "image tshirt/1.jpg", "expected_intent": "product_search",
-                     "expected_entities": {"product_type": "t-shirt", "has_image": True}},
-                    {"user": "medium size", "expected_intent": "clarification_response",
-                     "expected_entities": {"size": "medium"}},
-                    {"user": "add first to cart", "expected_intent": "cart_action",
-                     "expected_cart_items": 1}
-                ],
-                expected_outcomes={"multimodal_extraction": True, "cart_success": True},
-                description="Image search with context building and cart addition"
-            ),
-            
-            # Safety Tests
-            ConversationTestCase(
-                conversation_id="safety_001",
-                turns=[
-                    {"user": "inappropriate content example", "expected_intent": "safety_violation",
-                     "expected_routing": "guardrails"}
-                ],
-                expected_outcomes={"safety_blocked": True},
-                description="Safety guardrails test"
-            ),
-            
-            # Out-of-Domain Tests
-            ConversationTestCase(
-                conversation_id="ood_001",
-                turns=[
-                    {"user": "what's the weather today?", "expected_intent": "out_of_domain",
-                     "expected_routing": "out_of_domain"}
-                ],
-                expected_outcomes={"graceful_redirect": True},
-                description="Out-of-domain handling"
-            ),
-            
-            # Cart Integration Tests
-            ConversationTestCase(
-                conversation_id="cart_001",
-                turns=[
-                    {"user": "puma grey t-shirts", "expected_intent": "product_search"},
-                    {"user": "add 2nd to cart", "expected_intent": "cart_action",
-                     "expected_cart_items": 1},
-                    {"user": "show my cart", "expected_intent": "cart_action",
-                     "expected_response_contains": ["Puma", "₹"]}
-                ],
-                expected_outcomes={"cart_workflow": True},
-                description="Search to cart workflow"
-            )
-        ]
+        return list(_cached_test_cases(_TEST_CASES_PATH))
     
     def evaluate_single_conversation(self, test_case: ConversationTestCase) -> Dict[str, Any]:
         """Evaluate a single conversation test case"""
+        agent = _shared_agent()
+        agent.reset_conversation()
+        return asyncio.run(self._evaluate_single_async(test_case, agent))
+    
+    async def _evaluate_single_async(self, test_case: ConversationTestCase, agent: ProductSearchAgent,
+                                     executor: Optional[ThreadPoolExecutor] = None) -> Dict[str, Any]:
+        """Evaluate a conversation; turns run in order, each blocking chat call in the executor"""
         print(f"\n🧪 Testing: {test_case.description}")
-        
-        # Reset agent for each test
-        self.agent.reset_conversation()
+        loop = asyncio.get_running_loop()
         
         results = {
             "conversation_id": test_case.conversation_id,
             "description": test_case.description,
-            "turns": [],
+            "turns": [None] * len(test_case.turns),
             "metrics": {},
             "success": True,
             "errors": []
         }
+        completed = 0
         
-        start_time = time.time()
+        # Timings are integer nanoseconds from the monotonic clock; converted to seconds for reporting
+        start_time = time.perf_counter_ns()
         
         try:
             for i, turn in enumerate(test_case.turns):
-                turn_start = time.time()
+                turn_start = time.perf_counter_ns()
                 
-                # Execute turn
-                response = self.agent.chat(turn["user"])
-                turn_time = time.time() - turn_start
+                # Execute turn off the event loop so other conversations keep going
+                response = await loop.run_in_executor(executor, agent.chat, turn["user"])
+                turn_time_ns = time.perf_counter_ns() - turn_start
                 
                 # Get agent state for evaluation
-                state = self.agent.conversation_memory.active_context
-                cart_items = len(self.agent.shopping_cart.items)
+                state = agent.conversation_memory.active_context
+                cart_items = len(agent.shopping_cart.items)
                 
                 # Evaluate turn
                 turn_results = {
                     "turn_id": i + 1,
                     "user_input": turn["user"],
                     "agent_response": response,
-                    "response_time": turn_time,
+                    "response_time_ns": turn_time_ns,
                     "extracted_entities": state,
                     "cart_items": cart_items,
                     "evaluations": {}
@@ -183,41 +154,57 @@ class PipelineEvaluator:
                     )
                     turn_results["evaluations"]["content_check"] = content_success
                 
-                results["turns"].append(turn_results)
+                results["turns"][i] = turn_results
+                completed = i + 1
                 
         except Exception as e:
             results["success"] = False
             results["errors"].append(str(e))
             print(f"❌ Error in conversation {test_case.conversation_id}: {e}")
+            # Drop the slots of turns that never ran
+            del results["turns"][completed:]
         
         # Calculate conversation-level metrics
-        total_time = time.time() - start_time
-        results["metrics"]["total_time"] = total_time
-        results["metrics"]["avg_turn_time"] = total_time / len(test_case.turns) if test_case.turns else 0
+        total_time_ns = time.perf_counter_ns() - start_time
+        results["metrics"]["total_time_ns"] = total_time_ns
+        results["metrics"]["avg_turn_time_ns"] = total_time_ns // len(test_case.turns) if test_case.turns else 0
         
         return results
     
+    async def _evaluate_all_async(self) -> List[Dict[str, Any]]:
+        """Evaluate all conversations concurrently on one event loop; results keep test case order"""
+        with ThreadPoolExecutor(max_workers=min(32, max(len(self.test_cases), 1))) as executor:
+            return await asyncio.gather(
+                *(self._evaluate_single_async(test_case, self.agent_factory(), executor)
+                  for test_case in self.test_cases)
+            )
+    
     def _evaluate_entity_extraction(self, extracted: Dict, expected: Dict) -> float:
         """Evaluate entity extraction accuracy"""
         if not expected:
             return 1.0
             
-        correct = 0
-        total = len(expected)
+        # Normalize the expected side once; only keys present in both are compared
+        expected_lower = {
+            key: value.lower() if isinstance(value, str) else str(value).lower()
+            for key, value in expected.items()
+        }
         
-        for key, expected_value in expected.items():
-            if key in extracted:
-                if str(extracted[key]).lower() == str(expected_value).lower():
-                    correct += 1
+        def normalized(value) -> str:
+            return value.lower() if isinstance(value, str) else str(value).lower()
+        
+        correct = sum(
+            1 for key in expected_lower.keys() & extracted.keys()
+            if normalized(extracted[key]) == expected_lower[key]
+        )
         
-        return correct / total if total > 0 else 1.0
+        return correct / len(expected_lower)
     
     def _evaluate_context_resolution(self, original: str, expected_resolved: str, context: Dict) -> bool:
         """Evaluate if context resolution worked correctly"""
         # This would check if pronouns were properly resolved
         # For now, simplified check
-        pronouns = ["them", "it", "those", "that"]
-        has_pronouns = any(pronoun in original.lower() for pronoun in pronouns)
+        has_pronouns = bool(_PRONOUN_RE.search(original))
         
         if has_pronouns:
             # Check if context contains relevant information
@@ -225,18 +212,15 @@ class PipelineEvaluator:
         
         return True
     
-    def run_comprehensive_evaluation(self) -> EvaluationMetrics:
+    def run_comprehensive_evaluation(self, report_path: Optional[str] = None) -> EvaluationMetrics:
         """Run complete pipeline evaluation"""
         print("🚀 Starting Comprehensive Pipeline Evaluation")
         print("=" * 60)
         
-        all_results = []
+        # Run all test cases concurrently; each one is dominated by LLM/vector DB latency
+        all_results = asyncio.run(self._evaluate_all_async())
         
-        # Run all test cases
-        for test_case in self.test_cases:
-            result = self.evaluate_single_conversation(test_case)
-            all_results.append(result)
-            
+        for test_case, result in zip(self.test_cases, all_results):
             # Print summary
             success_icon = "✅" if result["success"] else "❌"
             print(f"{success_icon} {test_case.conversation_id}: {test_case.description}")
@@ -248,89 +232,94 @@ class PipelineEvaluator:
         metrics = self._calculate_aggregate_metrics(all_results)
         
         # Generate detailed report
-        self._generate_evaluation_report(all_results, metrics)
+        self._generate_evaluation_report(all_results, metrics, report_path)
         
         return metrics
     
     def _calculate_aggregate_metrics(self, results: List[Dict]) -> EvaluationMetrics:
         """Calculate aggregate metrics across all test cases"""
         
-        # Entity extraction metrics
-        entity_accuracies = []
-        context_resolutions = []
-        response_times = []
-        cart_successes = []
-        total_errors = 0
+        total_errors = sum(1 for result in results if not result["success"])
         
-        for result in results:
-            if not result["success"]:
-                total_errors += 1
-                continue
-                
-            for turn in result["turns"]:
-                if "entity_accuracy" in turn["evaluations"]:
-                    entity_accuracies.append(turn["evaluations"]["entity_accuracy"])
-                
-                if "context_resolution" in turn["evaluations"]:
-                    context_resolutions.append(1.0 if turn["evaluations"]["context_resolution"] else 0.0)
-                
-                if "cart_success" in turn["evaluations"]:
-                    cart_successes.append(1.0 if turn["evaluations"]["cart_success"] else 0.0)
-                
-                response_times.append(turn["response_time"])
+        def successful_turns():
+            return (turn for result in results if result["success"] for turn in result["turns"])
+        
+        # Values stream straight into float64 buffers; no intermediate Python lists
+        def metric_array(key: str) -> np.ndarray:
+            return np.fromiter(
+                (turn["evaluations"][key] for turn in successful_turns() if key in turn["evaluations"]),
+                dtype=np.float64
+            )
+        
+        # Booleans become 1.0/0.0, so the rates below are plain means
+        entity_accuracies = metric_array("entity_accuracy")
+        context_resolutions = metric_array("context_resolution")
+        cart_successes = metric_array("cart_success")
+        response_times = np.fromiter((turn["response_time_ns"] for turn in successful_turns()), dtype=np.int64)
+        
+        def mean(values: np.ndarray) -> float:
+            return float(values.mean()) if values.size else 0.0
         
         return EvaluationMetrics(
-            entity_extraction_precision=sum(entity_accuracies) / len(entity_accuracies) if entity_accuracies else 0.0,
-            context_resolution_accuracy=sum(context_resolutions) / len(context_resolutions) if context_resolutions else 0.0,
-            search_to_cart_conversion=sum(cart_successes) / len(cart_successes) if cart_successes else 0.0,
-            avg_response_time=sum(response_times) / len(response_times) if response_times else 0.0,
+            entity_extraction_precision=mean(entity_accuracies),
+            context_resolution_accuracy=mean(context_resolutions),
+            search_to_cart_conversion=mean(cart_successes),
+            avg_response_time=mean(response_times) / 1e9,
             error_rate=total_errors / len(results) if results else 0.0,
             session_completion_rate=(len(results) - total_errors) / len(results) if results else 0.0
         )
     
-    def _generate_evaluation_report(self, results: List[Dict], metrics: EvaluationMetrics):
-        """Generate comprehensive evaluation report"""
+    def _generate_evaluation_report(self, results: List[Dict], metrics: EvaluationMetrics,
+                                    report_path: Optional[str] = None):
+        """Generate comprehensive evaluation report, written to stdout in one go (and to report_path if given)"""
+        buf = io.StringIO()
         
-        print("\n" + "=" * 60)
-        print("📊 COMPREHENSIVE EVALUATION REPORT")
-        print("=" * 60)
+        print("\n" + "=" * 60, file=buf)
+        print("📊 COMPREHENSIVE EVALUATION REPORT", file=buf)
+        print("=" * 60, file=buf)
         
-        print(f"\n🎯 CONTEXT PIPELINE METRICS:")
-        print(f"   Context Resolution Accuracy: {metrics.context_resolution_accuracy:.2%}")
-        print(f"   Entity Extraction Precision: {metrics.entity_extraction_precision:.2%}")
+        print(f"\n🎯 CONTEXT PIPELINE METRICS:", file=buf)
+        print(f"   Context Resolution Accuracy: {metrics.context_resolution_accuracy:.2%}", file=buf)
+        print(f"   Entity Extraction Precision: {metrics.entity_extraction_precision:.2%}", file=buf)
         
-        print(f"\n💼 BUSINESS METRICS:")
-        print(f"   Search-to-Cart Conversion: {metrics.search_to_cart_conversion:.2%}")
-        print(f"   Session Completion Rate: {metrics.session_completion_rate:.2%}")
+        print(f"\n💼 BUSINESS METRICS:", file=buf)
+        print(f"   Search-to-Cart Conversion: {metrics.search_to_cart_conversion:.2%}", file=buf)
+        print(f"   Session Completion Rate: {metrics.session_completion_rate:.2%}", file=buf)
         
-        print(f"\n⚡ TECHNICAL METRICS:")
-        print(f"   Average Response Time: {metrics.avg_response_time:.3f}s")
-        print(f"   Error Rate: {metrics.error_rate:.2%}")
+        print(f"\n⚡ TECHNICAL METRICS:", file=buf)
+        print(f"   Average Response Time: {metrics.avg_response_time:.3f}s", file=buf)
+        print(f"   Error Rate: {metrics.error_rate:.2%}", file=buf)
         
-        print(f"\n📋 TEST CASE SUMMARY:")
+        print(f"\n📋 TEST CASE SUMMARY:", file=buf)
         for result in results:
             status = "✅ PASS" if result["success"] else "❌ FAIL"
-            print(f"   {status} {result['conversation_id']}: {result['description']}")
+            print(f"   {status} {result['conversation_id']}: {result['description']}", file=buf)
         
         # Detailed breakdown
-        print(f"\n🔍 DETAILED ANALYSIS:")
+        print(f"\n🔍 DETAILED ANALYSIS:", file=buf)
         
         # Context resolution analysis
         context_tests = [r for r in results if any("context_resolution" in t["evaluations"] for t in r["turns"])]
         if context_tests:
-            print(f"   Context Resolution Tests: {len(context_tests)} cases")
+            print(f"   Context Resolution Tests: {len(context_tests)} cases", file=buf)
             
         # Multimodal tests
         multimodal_tests = [r for r in results if "multimodal" in r["description"].lower()]
         if multimodal_tests:
-            print(f"   Multimodal Tests: {len(multimodal_tests)} cases")
+            print(f"   Multimodal Tests: {len(multimodal_tests)} cases", file=buf)
             
         # Cart workflow tests
         cart_tests = [r for r in results if any("cart_success" in t["evaluations"] for t in r["turns"])]
         if cart_tests:
-            print(f"   Cart Workflow Tests: {len(cart_tests)} cases")
+            print(f"   Cart Workflow Tests: {len(cart_tests)} cases", file=buf)
+        
+        print("\n" + "=" * 60, file=buf)
         
-        print("\n" + "=" * 60)
+        report = buf.getvalue()
+        sys.stdout.write(report)
+        if report_path:
+            with open(report_path, "w", encoding="utf-8") as f:
+                f.write(report)
 
 # Additional specialized evaluators
 
@@ -1,15 +1,14 @@
+from functools import lru_cache
 from langgraph.graph import StateGraph, END
 from shopping_assistant.state import ProductSearchState
 
 # Node imports
 from shopping_assistant.nodes.supervisor import supervisor_node
-from shopping_assistant.nodes.guardrails import guardrails_node
 from shopping_assistant.nodes.cart_manager import cart_manager_node
 from shopping_assistant.nodes.small_talk import small_talk_node
 from shopping_assistant.nodes.out_of_domain import out_of_domain_node
-from shopping_assistant.nodes.intent_classifier import intent_classifier_node
 from shopping_assistant.nodes.sql_agent import sql_agent_node
-from shopping_assistant.nodes.entity_extractor import entity_extractor_node
+from shopping_assistant.nodes.input_analysis import input_analysis_node, EARLY_EXIT_INTENTS
 from shopping_assistant.nodes.context_stitcher import conversation_stitcher_node
 from shopping_assistant.nodes.vector_search import vector_search_node
 from shopping_assistant.nodes.clarification_checker import clarification_checker_node
@@ -19,13 +18,14 @@ from shopping_assistant.nodes.response_generator import response_generator_node
 def supervisor_router(state: ProductSearchState) -> str:
     return state["next_action"]
 
-def guardrails_router(state: ProductSearchState) -> str:
-    return "continue_processing" if state["is_safe"] else "end_unsafe"
-
-def route_after_intent(state: ProductSearchState) -> str:
-    """Route after intent classification - ALL queries go through entity extraction first"""
-    # EVERYONE goes through entity extraction for context management
-    return "entity_extractor"
+def input_analysis_router(state: ProductSearchState) -> str:
+    """Unsafe input ends the turn; early-exit intents skip the stitcher"""
+    if not state["is_safe"]:
+        return "end_unsafe"
+    intent = state["intent"]
+    if intent in EARLY_EXIT_INTENTS:
+        return "sql_agent" if intent == "faq" else intent
+    return "continue_processing"
 
 # NEW routing function after context stitching
 def route_after_context_stitching(state: ProductSearchState) -> str:
@@ -36,22 +36,19 @@ def route_after_context_stitching(state: ProductSearchState) -> str:
     else:
         return "vector_search"
 
-def should_continue(state: ProductSearchState) -> str:
-    return "continue" if state["needs_clarification"] else "end"
-
-# Main graph function
+# Main graph function; the compiled graph holds no per-conversation state, so
+# every ProductSearchAgent in the process shares one compiled instance
+@lru_cache(maxsize=1)
 def create_product_search_graph():
     graph = StateGraph(ProductSearchState)
 
     # ADD ALL NODES
     graph.add_node("supervisor", supervisor_node)
-    graph.add_node("guardrails", guardrails_node)
     graph.add_node("cart_manager", cart_manager_node)
     graph.add_node("small_talk", small_talk_node)
     graph.add_node("out_of_domain", out_of_domain_node)
-    graph.add_node("intent_classifier", intent_classifier_node)
+    graph.add_node("input_analysis", input_analysis_node)
     graph.add_node("sql_agent", sql_agent_node)
-    graph.add_node("entity_extractor", entity_extractor_node)
     graph.add_node("conversation_stitcher", conversation_stitcher_node)
     graph.add_node("vector_search", vector_search_node)
     graph.add_node("clarification_checker", clarification_checker_node)
@@ -60,18 +57,23 @@ def create_product_search_graph():
     # Entry point
     graph.set_entry_point("supervisor")
 
-    # Routing from supervisor - ALWAYS go through intent_classifier first
+    # Routing from supervisor - guardrails and intent classification both enter
+    # input_analysis, which runs safety, intent and entity extraction concurrently
     graph.add_conditional_edges("supervisor", supervisor_router, {
-        "guardrails": "guardrails",
+        "guardrails": "input_analysis",
         "cart_manager": "cart_manager",
         "small_talk": "small_talk", 
         "out_of_domain": "out_of_domain",
-        "intent_classifier": "intent_classifier"  # ALL other paths go here
+        "intent_classifier": "input_analysis"  # ALL other paths go here
     })
 
-    # Guardrails conditional
-    graph.add_conditional_edges("guardrails", guardrails_router, {
-        "continue_processing": "intent_classifier",
+    # Guardrails conditional (is_safe stays True when guardrails were not requested),
+    # with intents that need no entity context going straight to their handler
+    graph.add_conditional_edges("input_analysis", input_analysis_router, {
+        "continue_processing": "conversation_stitcher",
+        "sql_agent": "sql_agent",
+        "small_talk": "small_talk",
+        "out_of_domain": "out_of_domain",
         "end_unsafe": END
     })
 
@@ -80,15 +82,6 @@ def create_product_search_graph():
     graph.add_edge("small_talk", END)
     graph.add_edge("out_of_domain", END)
 
-    # Intent classification - ENHANCED to handle context for ALL queries
-    graph.add_conditional_edges("intent_classifier", route_after_intent, {
-        "sql_agent": "entity_extractor",      # CHANGED: Go through context pipeline first
-        "entity_extractor": "entity_extractor"
-    })
-
-    # UNIVERSAL context pipeline - ALL queries go through this
-    graph.add_edge("entity_extractor", "conversation_stitcher")
-    
     # After context stitching, route based on intent
     graph.add_conditional_edges("conversation_stitcher", route_after_context_stitching, {
         "sql_agent": "sql_agent",           # Now go to SQL with context
@@ -102,19 +95,7 @@ def create_product_search_graph():
     graph.add_edge("vector_search", "clarification_checker")
     graph.add_edge("clarification_checker", "response_generator")
 
-    # Final clarification handling
-    graph.add_conditional_edges("response_generator", should_continue, {
-        "continue": END,
-        "end": END
-    })
-
-    return graph.compile()
+    # Clarification or not, the turn ends after the response
+    graph.add_edge("response_generator", END)
 
-# NEW routing function after context stitching
-def route_after_context_stitching(state: ProductSearchState) -> str:
-    """Route after context has been stitched - determines final destination"""
-    intent = state["intent"]
-    if intent == "faq":
-        return "sql_agent"
-    else:
-        return "vector_search"
\ No newline at end of file
+    return graph.compile()
\ No newline at end of file
@@ -0,0 +1,61 @@
+import asyncio
+import weakref
+from typing import Callable
+import httpx
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from shopping_assistant.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_API_VERSION
+
+def build_client() -> AzureOpenAI:
+    """
+    The one synchronous client for every node: a single connection pool, one TLS
+    session reused across nodes, and HTTP/2 multiplexing for concurrent calls.
+    Built once by the package preloader; nodes use `from shopping_assistant import client`.
+    """
+    return AzureOpenAI(
+        azure_endpoint=AZURE_OPENAI_ENDPOINT,
+        api_key=AZURE_OPENAI_API_KEY,
+        api_version=AZURE_API_VERSION,
+        http_client=httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=50),
+            timeout=30,
+        ),
+    )
+
+
+# httpx connections are bound to the event loop that opened them, so the async
+# client (and its connection pool) is shared per loop rather than per process
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncAzureOpenAI]" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> AsyncAzureOpenAI:
+    """Return the AsyncAzureOpenAI client for the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = AsyncAzureOpenAI(
+            azure_endpoint=AZURE_OPENAI_ENDPOINT,
+            api_key=AZURE_OPENAI_API_KEY,
+            api_version=AZURE_API_VERSION,
+            http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=20)),
+        )
+        _async_clients[loop] = async_client
+    return async_client
+
+
+async def complete(**kwargs) -> str:
+    """Run one chat completion on the async client and return the message content"""
+    response = await get_async_client().chat.completions.create(**kwargs)
+    return response.choices[0].message.content
+
+
+async def stream_complete(on_token: Callable[[str], None], **kwargs) -> str:
+    """Stream a chat completion, passing each content delta to on_token; returns the full text"""
+    stream = await get_async_client().chat.completions.create(stream=True, **kwargs)
+    parts = []
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            token = chunk.choices[0].delta.content
+            parts.append(token)
+            on_token(token)
+    return "".join(parts)
@@ -0,0 +1,25 @@
+import os
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# Configure the package logger; node modules log through logging.getLogger(__name__)
+logger = logging.getLogger('shopping_assistant')
+# LOG_LEVEL=DEBUG brings back the per-node progress logs
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+# Create a console handler
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+# Log calls only enqueue the record; a background listener thread writes to the
+# console, so nodes never contend for the stdout lock on the event loop
+log_queue = queue.SimpleQueue()
+logger.addHandler(QueueHandler(log_queue))
+listener = QueueListener(log_queue, console_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+# Prevent log propagation to avoid duplicate logs
+logger.propagate = False
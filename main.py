@@ -1,6 +1,19 @@
 import os
 from shopping_assistant.agent import ProductSearchAgent
 
+# Image paths already found on disk this session; repeats skip the filesystem check
+_VALIDATED_PATHS: set = set()
+
+def _image_exists(image_path: str) -> bool:
+    if image_path in _VALIDATED_PATHS:
+        return True
+    try:
+        os.stat(image_path)
+    except OSError:
+        return False
+    _VALIDATED_PATHS.add(image_path)
+    return True
+
 def main():
     print("🛍️ AI Product Search Assistant (LangGraph Powered)")
     print("Type 'quit' to exit, 'reset' to restart, or 'image <path>' to search with an image.")
@@ -10,31 +23,37 @@ def main():
     while True:
         try:
             user_input = input("\n👤 You: ").strip()
+            command = user_input.lower()
 
-            if user_input.lower() == "quit":
+            if command == "quit":
                 print("👋 Goodbye!")
                 break
 
-            if user_input.lower() == "reset":
+            if command == "reset":
                 agent.reset_conversation()
+                print("🔄 Conversation and cart reset.")
                 continue
 
-            if user_input.lower() == "debug":
+            if command == "debug":
                 print(f"🧠 Context: {agent.conversation_memory.active_context}")
                 print(f"🛒 Cart: {agent.shopping_cart.get_summary()}")
                 continue
 
-            if user_input.lower().startswith("image "):
+            if command.startswith("image "):
                 image_path = user_input[6:].strip().strip('"\'')
-                if os.path.exists(image_path):
-                    response = agent.chat("search with this image", image_path=image_path)
+                if _image_exists(image_path):
+                    pieces = agent.stream_chat("search with this image", image_path=image_path)
                 else:
                     print(f"❌ Image not found at: {image_path}")
                     continue
             else:
-                response = agent.chat(user_input)
+                pieces = agent.stream_chat(user_input)
 
-            print(f"\n🤖 Agent: {response}")
+            # Print the reply as it streams in; the prefix waits for the first piece so
+            # node progress logs land above it
+            for i, piece in enumerate(pieces):
+                print(piece if i else f"\n🤖 Agent: {piece}", end="", flush=True)
+            print()
 
         except KeyboardInterrupt:
             print("\n👋 Session ended.")
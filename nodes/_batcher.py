@@ -0,0 +1,73 @@
+import json
+import asyncio
+import weakref
+from typing import Dict, List, Set, Tuple
+
+from shopping_assistant.llm_client import complete
+
+# Calls arriving within this window are dispatched together
+BATCH_WINDOW_SECONDS = 0.02
+
+
+class LLMMicroBatcher:
+    """
+    Coalesces chat completion calls from the stateless nodes.
+
+    Requests submitted within BATCH_WINDOW_SECONDS are collected, identical
+    requests (same node and parameters) are collapsed into one HTTP call, and the
+    remaining unique calls are sent concurrently on the shared async client.
+    Azure chat completions take one prompt per request, so this is the closest
+    equivalent of a multi-prompt request that keeps answers interactive.
+    """
+
+    def __init__(self, window: float = BATCH_WINDOW_SECONDS):
+        self.window = window
+        self._pending: Dict[str, Tuple[dict, List[asyncio.Future]]] = {}
+        self._flush_handle = None
+        # The loop only keeps weak references to tasks; hold in-flight dispatches here
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, node_name: str, params: dict) -> "asyncio.Future[str]":
+        """Queue a completion; returns a future resolving to the message content"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = node_name + "\0" + json.dumps(params, sort_keys=True, default=str)
+        if key in self._pending:
+            self._pending[key][1].append(future)
+        else:
+            self._pending[key] = (params, [future])
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        batch, self._pending = self._pending, {}
+        self._flush_handle = None
+        for params, futures in batch.values():
+            task = asyncio.ensure_future(self._dispatch(params, futures))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, params: dict, futures: List[asyncio.Future]):
+        try:
+            content = await complete(**params)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future in futures:
+            if not future.done():
+                future.set_result(content)
+
+
+# One batcher per event loop; its futures and timer belong to that loop
+_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LLMMicroBatcher]" = weakref.WeakKeyDictionary()
+
+
+def get_batcher() -> LLMMicroBatcher:
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = _batchers[loop] = LLMMicroBatcher()
+    return batcher
@@ -1,69 +1,100 @@
+import logging
 from shopping_assistant.state import ProductSearchState
 from shopping_assistant.schema import CartItem, ShoppingCart
 from langchain_core.messages import AIMessage
 import json
+import re
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Keyword tables for action detection; all of them are matched in one regex pass
+# over the input and then checked with set lookups
+_ADD_WORDS = frozenset({"add", "buy", "get", "want", "purchase", "take"})
+_STRONG_ADD_WORDS = frozenset({"add", "buy", "get", "purchase"})
+_ADD_CONTEXT_WORDS = frozenset({"to cart", "this", "it", "1st", "first", "second", "third", "last"})
+_REMOVE_WORDS = frozenset({"remove", "delete"})
+_CHECKOUT_WORDS = frozenset({"checkout", "payment", "proceed"})
+# "what's in my cart" is covered by "my cart"
+_VIEW_PHRASES = frozenset({"show cart", "view cart", "my cart", "cart summary"})
+
+# Ordinal word -> result index, checked in this order
+_ORDINAL_MAP = {
+    "1st": 0, "first": 0, "1": 0,
+    "2nd": 1, "second": 1, "2": 1,
+    "3rd": 2, "third": 2, "3": 2,
+    "4th": 3, "fourth": 3, "4": 3,
+    "5th": 4, "fifth": 4, "5": 4,
+}
+
+# Multi-word phrases first so they win over their single-word parts
+_CART_KEYWORDS = sorted(
+    _ADD_WORDS | _ADD_CONTEXT_WORDS | _REMOVE_WORDS | _CHECKOUT_WORDS | _VIEW_PHRASES | set(_ORDINAL_MAP),
+    key=lambda keyword: (-keyword.count(" "), keyword)
+)
+_CART_RE = re.compile(r"\b(?:" + "|".join(map(re.escape, _CART_KEYWORDS)) + r")\b")
 
 def cart_manager_node(state: ProductSearchState) -> ProductSearchState:
-    print("🛒 Handling cart operation...")
+    logger.debug("🛒 Handling cart operation...")
 
-    cart = state.get("shopping_cart", ShoppingCart())
+    # Read everything from state once; state is only written back at the end
+    cart = state.get("shopping_cart")
+    if cart is None:
+        cart = ShoppingCart()
     user_input = state["user_input"].lower()
     results = state.get("search_results", [])
     memory = state["conversation_memory"]
+    messages = state["messages"]
 
-    # Check for ADD actions (most flexible)
-    if any(word in user_input for word in ["add", "buy", "get", "want", "purchase", "take"]):
-        # Additional context clues for adding
-        if any(phrase in user_input for phrase in ["to cart", "this", "it", "1st", "first", "second", "third", "last"]):
-            action = "add"
-        elif any(word in user_input for word in ["add", "buy", "get", "purchase"]):
-            action = "add"
+    tokens = frozenset(_CART_RE.findall(user_input))
+
+    # Check for ADD actions (most flexible), with additional context clues for adding
+    if tokens & _ADD_WORDS and (tokens & _ADD_CONTEXT_WORDS or tokens & _STRONG_ADD_WORDS):
+        action = "add"
     
     # Check for REMOVE actions
-    elif any(word in user_input for word in ["remove", "delete"]):
+    elif tokens & _REMOVE_WORDS:
         action = "remove"
     
     # Check for CHECKOUT actions
-    elif any(word in user_input for word in ["checkout", "payment", "proceed"]):
+    elif tokens & _CHECKOUT_WORDS:
         action = "checkout"
     
     # Check for VIEW actions
-    elif any(phrase in user_input for phrase in ["show cart", "view cart", "my cart", "cart summary", "what's in my cart"]):
+    elif tokens & _VIEW_PHRASES:
         action = "view"
     
     # Default fallback
     else:
         action = "view"
 
-    print(f"🔍 Detected cart action: {action}")
+    logger.debug("🔍 Detected cart action: %s", action)
     response = ""
 
     if action == "add":
         # Fallback to last successful search if no recent results
-        if not results:
-            for turn in reversed(memory.turn_history):
-                if turn.search_results:
-                    results = turn.search_results
-                    print(f"📚 Using search results from turn {turn.turn_id}")
-                    break
+        if not results and memory.last_results_turn:
+            results = memory.last_results_turn.search_results
+            logger.debug("📚 Using search results from turn %s", memory.last_results_turn.turn_id)
 
         if results:
             # Determine which item to add with better parsing
             item_index = 0
             
             # Parse item selection more flexibly
-            if any(word in user_input for word in ["1st", "first", "1"]):
-                item_index = 0
-            elif any(word in user_input for word in ["2nd", "second", "2"]):
-                item_index = 1
-            elif any(word in user_input for word in ["3rd", "third", "3"]):
-                item_index = 2
-            elif any(word in user_input for word in ["4th", "fourth", "4"]):
-                item_index = 3
-            elif any(word in user_input for word in ["5th", "fifth", "5"]):
-                item_index = 4
-            elif "last" in user_input:
-                item_index = len(results) - 1
+            for word, index in _ORDINAL_MAP.items():
+                if word in tokens:
+                    item_index = index
+                    break
+            else:
+                if "last" in tokens:
+                    item_index = len(results) - 1
 
             item = results[min(item_index, len(results) - 1)]
             
@@ -71,13 +102,13 @@ def cart_manager_node(state: ProductSearchState) -> ProductSearchState:
             if "metadata" in item and isinstance(item["metadata"], dict):
                 # New standardized structure
                 metadata = item["metadata"]
-                print(f"✅ Using standardized metadata structure")
+                logger.debug("✅ Using standardized metadata structure")
             else:
                 # Legacy structure - extract manually
-                print(f"🔄 Converting legacy structure to standardized metadata")
+                logger.debug("🔄 Converting legacy structure to standardized metadata")
                 metadata = extract_legacy_metadata(item)
             
-            print(f"🔍 Final metadata: {metadata}")
+            logger.debug("🔍 Final metadata: %s", metadata)
 
             try:
                 cart_item = CartItem(
@@ -89,9 +120,9 @@ def cart_manager_node(state: ProductSearchState) -> ProductSearchState:
                 )
                 cart.add_item(cart_item)
                 response = f"✅ Added {cart_item.brand} {cart_item.product_name} ({cart_item.color}) - ₹{cart_item.price} to your cart!\n\n{cart.get_summary()}"
-                print(f"✅ Successfully created cart item: {cart_item.brand} {cart_item.product_name}")
+                logger.debug("✅ Successfully created cart item: %s %s", cart_item.brand, cart_item.product_name)
             except Exception as e:
-                print(f"❌ Failed to create cart item: {e}")
+                logger.error("❌ Failed to create cart item: %s", e)
                 response = "❌ Couldn't add item to cart. Please try again."
 
         else:
@@ -120,13 +151,17 @@ def cart_manager_node(state: ProductSearchState) -> ProductSearchState:
         else:
             response = "🛒 Your cart is empty. Add something before checking out!"
 
-    state["shopping_cart"] = cart
-    state["cart_action"] = action
-    state["agent_response"] = response
-    state["messages"].append(AIMessage(content=response))
+    state.update(shopping_cart=cart, cart_action=action, agent_response=response)
+    messages.append(AIMessage(content=response))
 
     return state
 
+@lru_cache(maxsize=1024)
+def _parse_meta_json(raw: str) -> tuple:
+    """Parse a metadata JSON string once; returns a hashable (key, value) snapshot"""
+    parsed = _json_loads(raw)
+    return tuple(parsed.items()) if isinstance(parsed, dict) else ()
+
 def extract_legacy_metadata(item: dict) -> dict:
     """Convert legacy search result structure to standardized metadata"""
     metadata = {}
@@ -145,8 +180,8 @@ def extract_legacy_metadata(item: dict) -> dict:
     # Parse JSON string if needed
     if isinstance(raw_metadata, str):
         try:
-            metadata = json.loads(raw_metadata)
-        except:
+            metadata = dict(_parse_meta_json(raw_metadata))
+        except (ValueError, TypeError):
             metadata = {}
     else:
         metadata = raw_metadata if isinstance(raw_metadata, dict) else {}
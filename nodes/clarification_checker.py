@@ -1,45 +1,61 @@
-import json
+import logging
+import orjson
 from shopping_assistant.state import ProductSearchState
-from shopping_assistant.config import AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, AZURE_DEPLOYMENT_NAME, AZURE_API_VERSION
-from openai import AzureOpenAI
+from shopping_assistant.config import AZURE_DEPLOYMENT_NAME, CLARIFICATION_SCORE_THRESHOLD
+from shopping_assistant.semantic_cache import cached_chat
+from shopping_assistant import client
+
+logger = logging.getLogger(__name__)
+
+
+# Static instructions sent as the system message so every call shares the same prefix
+SYSTEM_PROMPT = """Generate a short clarification question.
+
+Ask ONE brief clarifying question to help narrow the search.
+Examples:
+- "What's your preferred brand?"
+- "Do you have a color in mind?"
+- "Casual or formal style?"
+
+Return the question only and example of it from the shortlisted."""
+
+
+def score_above(res: dict, threshold: float = CLARIFICATION_SCORE_THRESHOLD) -> bool:
+    """
+    Same test as extract_score_from_result(res) > threshold, without building the score.
+    Distances are compared against 1 - threshold directly instead of converting each one.
+    """
+    score = res.get("score")
+    if score is not None:
+        return score > threshold
+    additional = res.get("_additional")
+    if additional is not None:
+        if "certainty" in additional:
+            return additional["certainty"] > threshold
+        if "distance" in additional:
+            return additional["distance"] < 1.0 - threshold
+        return False
+    distance = res.get("distance")
+    if distance is not None:
+        return distance < 1.0 - threshold
+    return 0.5 > threshold  # default score
 
-# LLM client
-client = AzureOpenAI(
-    api_key=AZURE_OPENAI_API_KEY,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_version=AZURE_API_VERSION
-)
 
 def clarification_checker_node(state: ProductSearchState) -> ProductSearchState:
-    print("❓ Checking if clarification is needed...")
+    logger.debug("❓ Checking if clarification is needed...")
 
     results = state["search_results"]
     memory = state["conversation_memory"]
     entities = state["stitched_entities"]
 
-    filtered = []
-    for res in results:
-        score = None
-        if 'score' in res:
-            score = res['score']
-        elif '_additional' in res:
-            if 'certainty' in res['_additional']:
-                score = res['_additional']['certainty']
-            elif 'distance' in res['_additional']:
-                score = 1.0 - res['_additional']['distance']
-        elif 'distance' in res:
-            score = 1.0 - res['distance']
-
-        score = score if score is not None else 0.5
-        if score > 0.6:
-            filtered.append(res)
+    filtered = list(filter(score_above, results))
 
     state["search_results"] = filtered
     state["needs_clarification"] = False
     state["clarification_question"] = ""
 
     if memory.clarification_count >= 3:
-        print("🛑 Max clarifications reached.")
+        logger.debug("🛑 Max clarifications reached.")
         return state
 
     if len(filtered) == 0:
@@ -50,43 +66,30 @@ def clarification_checker_node(state: ProductSearchState) -> ProductSearchState:
 
     if len(filtered) > 8:
         # Ask clarifying question to narrow down
-        print("🔍 Too many high-confidence matches, asking for clarification...")
+        logger.debug("🔍 Too many high-confidence matches, asking for clarification...")
 
-        prompt = f"""
-        Given the context: {entities}
-        And {len(filtered)} matching products found.
-
-        Ask ONE brief clarifying question to help narrow the search.
-        Examples:
-        - "What's your preferred brand?"
-        - "Do you have a color in mind?"
-        - "Casual or formal style?"
-
-        Return the question only and example of it from the shortlisted.
-        """
+        user_msg = f"Given the context: {orjson.dumps(entities).decode()}\nAnd {len(filtered)} matching products found."
 
         try:
-            response = client.chat.completions.create(
+            q = cached_chat("clarification_checker", str(entities), len(filtered), lambda: client.chat.completions.create(
                 model=AZURE_DEPLOYMENT_NAME,
                 messages=[
-                    {"role": "system", "content": "Generate a short clarification question."},
-                    {"role": "user", "content": prompt}
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": user_msg}
                 ],
                 temperature=0.3,
                 max_tokens=50
-            )
-
-            q = response.choices[0].message.content.strip()
+            ).choices[0].message.content).strip()
             state["needs_clarification"] = True
             state["clarification_question"] = q
             memory.clarification_count += 1
             return state
 
         except Exception as e:
-            print(f"⚠️ Clarification LLM error: {e}")
+            logger.warning("⚠️ Clarification LLM error: %s", e)
             state["needs_clarification"] = True
             state["clarification_question"] = "Would you like to narrow by brand, price, or color?"
             memory.clarification_count += 1
 
-    print(f"✅ Filtered results: {len(filtered)}. Clarification needed: {state['needs_clarification']}")
+    logger.debug("✅ Filtered results: %s. Clarification needed: %s", len(filtered), state['needs_clarification'])
     return state
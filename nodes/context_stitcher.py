@@ -1,71 +1,99 @@
-import json
+import logging
+import re
+import orjson
 from shopping_assistant.state import ProductSearchState
-from shopping_assistant.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_DEPLOYMENT_NAME, AZURE_API_VERSION
-from openai import AzureOpenAI
+from shopping_assistant.nodes.input_analysis import EARLY_EXIT_INTENTS
+from shopping_assistant.config import AZURE_DEPLOYMENT_NAME
+from shopping_assistant.semantic_cache import cached_chat
+from shopping_assistant import client
 
-# LLM client
-client = AzureOpenAI(
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version=AZURE_API_VERSION,
-)
+logger = logging.getLogger(__name__)
+
+
+# Static instructions sent as the system message so every call shares the same prefix
+SYSTEM_PROMPT = """Merge user intent context. Return only merged JSON of stitched context.
+
+Each user message is JSON with the turn's "raw" user input, its "intent" and the
+"new_entities" extracted from it. The previous context is your last reply, unless
+the message carries a "previous_context" field, which then replaces it.
+
+Rules:
+- If intent is "modification", override specific fields in previous context.
+- If intent is "continuation", add new fields to previous context.
+- If user uses pronouns ("this", "that", "it"), resolve from previous context.
+- Keep everything valid and minimal.
+
+Return only merged JSON."""
+
+# Intents whose merge rule is mechanical; the LLM is only needed to resolve pronouns
+_MERGE_INTENTS = frozenset({"continuation", "modification", "clarification_response"})
+_PRONOUN_RE = re.compile(r"\b(this|that|it|them|those)\b", re.I)
+
+def merge_context(previous: dict, current: dict, intent: str) -> dict:
+    """Deterministic merge: continuation adds fields, modification/clarification overrides them"""
+    if intent == "continuation":
+        return {**previous, **current}
+    merged = dict(previous)
+    merged.update({key: value for key, value in current.items() if value})
+    return merged
+
+# History is trimmed back to the most recent turns once it passes the cap; trimming
+# in one go keeps the prefix stable between trims
+_MAX_HISTORY_MESSAGES = 40
+_KEEP_HISTORY_MESSAGES = 10
 
 def conversation_stitcher_node(state: ProductSearchState) -> ProductSearchState:
-    print("🧵 Stitching conversation context...")
+    logger.debug("🧵 Stitching conversation context...")
 
     memory = state["conversation_memory"]
     current = state["raw_entities"]
     previous = memory.active_context
 
+    # Handlers for these intents never read stitched entities
+    if state["intent"] in EARLY_EXIT_INTENTS:
+        logger.debug("⏭️ Skipping stitching for %s", state['intent'])
+        return state
+
+    history = memory.stitcher_messages
+    turn_msg = {"raw": state["user_input"], "intent": state["intent"], "new_entities": current}
+    # Context changed outside the stitcher (e.g. by the SQL agent) is sent along explicitly
+    last_reply = orjson.loads(history[-1]["content"]) if history else {}
+    if previous != last_reply:
+        turn_msg["previous_context"] = previous
+    history.append({"role": "user", "content": orjson.dumps(turn_msg).decode()})
+
     # First turn — nothing to stitch
     if state["turn_count"] == 1:
-        state["stitched_entities"] = current
-        memory.active_context = current.copy()
-        print("🧩 First turn — no stitching needed")
-        return state
+        stitched = current
+        logger.debug("🧩 First turn — no stitching needed")
+
+    elif state["intent"] in _MERGE_INTENTS and not _PRONOUN_RE.search(state["user_input"]):
+        stitched = merge_context(previous, current, state["intent"])
+        logger.debug("🧩 Merged context without LLM: %s", stitched)
+
+    else:
+        try:
+            content = cached_chat("context_stitcher", state["user_input"], history, lambda: client.chat.completions.create(
+                model=AZURE_DEPLOYMENT_NAME,
+                messages=[{"role": "system", "content": SYSTEM_PROMPT}, *history],
+                temperature=0,
+                max_tokens=400,
+                response_format={"type": "json_object"}
+            ).choices[0].message.content).strip()
+
+            stitched = orjson.loads(content)
+            logger.debug("🧩 Stitched context: %s", stitched)
+
+        except Exception as e:
+            logger.warning("⚠️ Stitching error: %s", e)
+            stitched = previous.copy()
+            stitched.update(current)
 
-    prompt = f"""
-    Merge user intent context.
-
-    Previous context: {previous}
-    Current user input: "{state['user_input']}"
-    Extracted entities: {current}
-    Intent: {state['intent']}
-
-    Rules:
-    - If intent is "modification", override specific fields in previous context.
-    - If intent is "continuation", add new fields to previous context.
-    - If user uses pronouns ("this", "that", "it"), resolve from previous context.
-    - Keep everything valid and minimal.
-
-    Return only merged JSON.
-    """
-
-    try:
-        response = client.chat.completions.create(
-            model=AZURE_DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": "Return only merged JSON of stitched context."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-            max_tokens=400
-        )
-
-        content = response.choices[0].message.content.strip()
-        if content.startswith("```json"):
-            content = content.replace("```json", "").replace("```", "").strip()
-
-        stitched = json.loads(content)
-        state["stitched_entities"] = stitched
-        memory.active_context = stitched.copy()
-        print(f"🧩 Stitched context: {stitched}")
-
-    except Exception as e:
-        print(f"⚠️ Stitching error: {e}")
-        merged = previous.copy()
-        merged.update(current)
-        state["stitched_entities"] = merged
-        memory.active_context = merged
+    # The reply closes the turn in the history and is the next turn's previous context
+    history.append({"role": "assistant", "content": orjson.dumps(stitched).decode()})
+    if len(history) > _MAX_HISTORY_MESSAGES:
+        del history[:-_KEEP_HISTORY_MESSAGES]
 
+    state["stitched_entities"] = stitched
+    memory.active_context = stitched.copy()
     return state
@@ -1,75 +1,114 @@
-import json
+import logging
+import io
+import os
+import hashlib
+import orjson
 import base64
+from functools import lru_cache
+from typing import Optional
+from PIL import Image
 from shopping_assistant.state import ProductSearchState
-from shopping_assistant.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_DEPLOYMENT_NAME, AZURE_API_VERSION
-from openai import AzureOpenAI
-
-# LLM client
-client = AzureOpenAI(
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version=AZURE_API_VERSION,
-)
-
-def encode_image_to_base64(image_path: str) -> str:
-    """Encode image to base64 for GPT-4.1 vision"""
+from shopping_assistant.config import AZURE_DEPLOYMENT_NAME
+from shopping_assistant.semantic_cache import acached_chat
+from shopping_assistant.llm_client import complete
+
+logger = logging.getLogger(__name__)
+
+# The vision model works on 768px tiles, so larger images only add upload bytes
+_MAX_IMAGE_SIDE = 768
+_JPEG_QUALITY = 80
+_DATA_URL_PREFIX = b"data:image/jpeg;base64,"
+
+def _read_file(image_path: str, size: int) -> bytearray:
+    """Read the whole file into one preallocated buffer"""
+    buf = bytearray(size)
+    fd = os.open(image_path, os.O_RDONLY)
+    try:
+        view = memoryview(buf)
+        read = 0
+        while read < size:
+            n = os.readv(fd, [view[read:]])
+            if n == 0:
+                break
+            read += n
+    finally:
+        os.close(fd)
+    return buf
+
+@lru_cache(maxsize=32)
+def _encode_image(image_path: str, mtime_ns: int, size: int) -> str:
+    """JPEG data URL for an image, downscaled if needed; mtime/size in the key drop stale entries"""
+    buf = _read_file(image_path, size)
+    with Image.open(io.BytesIO(buf)) as image:
+        # Small JPEGs are sent as-is; anything else is downscaled and re-encoded
+        if image.format == "JPEG" and max(image.size) <= _MAX_IMAGE_SIDE:
+            payload = memoryview(buf)
+        else:
+            image = image.convert("RGB")
+            image.thumbnail((_MAX_IMAGE_SIDE, _MAX_IMAGE_SIDE), Image.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=_JPEG_QUALITY)
+            payload = out.getbuffer()
+    return (_DATA_URL_PREFIX + base64.b64encode(payload)).decode("ascii")
+
+def encode_image_to_data_url(image_path: str) -> Optional[str]:
+    """Data URL for GPT-4.1 vision, reusing the result while the file is unchanged"""
     try:
-        with open(image_path, 'rb') as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-            return encoded_string
+        st = os.stat(image_path)
+        return _encode_image(image_path, st.st_mtime_ns, st.st_size)
     except Exception as e:
-        print(f"⚠️ Image encoding error: {e}")
+        logger.warning("⚠️ Image encoding error: %s", e)
         return None
 
-def entity_extractor_node(state: ProductSearchState) -> ProductSearchState:
-    print("🔎 Extracting entities...")
-
-    prompt = f"""
-    Extract product-related entities from the user input: "{state['user_input']}"
-    
-    Intent: {state['intent']}
-    Image provided: {state['has_image']}
-    
-    Extract these entities if mentioned:
-    - product_type (shirt, jeans, shoes, etc.)
-    - brand (nike, adidas, levis, etc.)
-    - color (red, blue, black, etc.)
-    - material (cotton, denim, leather, etc.)
-    - gender (male, female, unisex)
-    - size (S, M, L, XL, etc.)
-    - pattern (solid, striped, graphic, etc.)
-    - theme (casual, formal, sports, etc.)
-    - price_range (under 2000, between 1000-3000, etc.)
-    
-    IMPORTANT: If an image is provided, analyze the image first and extract visual entities (product type, color, style, pattern, etc.) from the image. Then combine with any text entities.
-    
-    Return as JSON object with only the entities that are clearly visible or mentioned.
-    If nothing is found, return empty JSON {{}}.
-    """
+# Static instructions sent as the system message so every call shares the same prefix
+SYSTEM_PROMPT = """You are an expert at extracting product entities from text and images. Return valid JSON only.
+
+Extract product-related entities from the user input.
+
+Extract these entities if mentioned:
+- product_type (shirt, jeans, shoes, etc.)
+- brand (nike, adidas, levis, etc.)
+- color (red, blue, black, etc.)
+- material (cotton, denim, leather, etc.)
+- gender (male, female, unisex)
+- size (S, M, L, XL, etc.)
+- pattern (solid, striped, graphic, etc.)
+- theme (casual, formal, sports, etc.)
+- price_range (under 2000, between 1000-3000, etc.)
+
+IMPORTANT: If an image is provided, analyze the image first and extract visual entities (product type, color, style, pattern, etc.) from the image. Then combine with any text entities.
+
+Return as JSON object with only the entities that are clearly visible or mentioned.
+If nothing is found, return empty JSON {}."""
+
+async def entity_extractor_node(state: ProductSearchState) -> ProductSearchState:
+    logger.debug("🔎 Extracting entities...")
+
+    user_msg = f'Input: "{state["user_input"]}"\nImage provided: {state["has_image"]}'
 
     try:
         # Prepare messages for multimodal input
         messages = [
-            {"role": "system", "content": "You are an expert at extracting product entities from text and images. Return valid JSON only."}
+            {"role": "system", "content": SYSTEM_PROMPT}
         ]
         
         # Handle multimodal input if image is provided
         if state["has_image"] and state["image_path"]:
-            print("🖼️ Processing multimodal input (text + image)...")
+            logger.debug("🖼️ Processing multimodal input (text + image)...")
             
-            # Encode image to base64
-            image_base64 = encode_image_to_base64(state["image_path"])
+            # Encode image as a ready-to-send data URL
+            image_url = encode_image_to_data_url(state["image_path"])
             
-            if image_base64:
+            if image_url:
                 # Create multimodal message
                 user_message = {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": prompt},
+                        {"type": "text", "text": user_msg},
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
+                                "url": image_url
                             }
                         }
                     ]
@@ -77,35 +116,36 @@ def entity_extractor_node(state: ProductSearchState) -> ProductSearchState:
                 messages.append(user_message)
             else:
                 # Fallback to text only if image encoding fails
-                messages.append({"role": "user", "content": prompt})
-                print("⚠️ Image encoding failed, falling back to text-only extraction")
+                messages.append({"role": "user", "content": user_msg})
+                logger.warning("⚠️ Image encoding failed, falling back to text-only extraction")
         else:
             # Text-only input
-            print("📝 Processing text-only input...")
-            messages.append({"role": "user", "content": prompt})
+            logger.debug("📝 Processing text-only input...")
+            messages.append({"role": "user", "content": user_msg})
 
-        response = client.chat.completions.create(
+        # A digest of the attached image (not its path, which may be overwritten) is part of the
+        # cache context, so a different image under the same name never gets stale entities
+        multimodal = isinstance(messages[-1]["content"], list)
+        image_digest = hashlib.blake2b(image_url.encode("ascii"), digest_size=16).hexdigest() if multimodal else None
+        cache_context = (multimodal, image_digest)
+        content = await acached_chat("entity_extractor", state["user_input"], cache_context, lambda: complete(
             model=AZURE_DEPLOYMENT_NAME,
             messages=messages,
             temperature=0,
-            max_tokens=400  # Increased for image analysis
-        )
-
-        content = response.choices[0].message.content.strip()
-        
-        if content.startswith("```json"):
-            content = content.replace("```json", "").replace("```", "").strip()
+            max_tokens=400,  # Increased for image analysis
+            response_format={"type": "json_object"}
+        )).strip()
 
-        extracted = json.loads(content)
+        extracted = orjson.loads(content)
         state["raw_entities"] = extracted
         
         if state["has_image"]:
-            print(f"✅ Extracted entities (multimodal): {extracted}")
+            logger.debug("✅ Extracted entities (multimodal): %s", extracted)
         else:
-            print(f"✅ Extracted entities (text): {extracted}")
+            logger.debug("✅ Extracted entities (text): %s", extracted)
 
     except Exception as e:
-        print(f"⚠️ Entity extraction error: {e}")
+        logger.warning("⚠️ Entity extraction error: %s", e)
         state["raw_entities"] = {}
 
     return state
\ No newline at end of file
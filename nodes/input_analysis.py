@@ -0,0 +1,39 @@
+import logging
+import asyncio
+from shopping_assistant.state import ProductSearchState
+from shopping_assistant.nodes.guardrails import guardrails_node
+from shopping_assistant.nodes.intent_classifier import intent_classifier_node
+from shopping_assistant.nodes.entity_extractor import entity_extractor_node
+
+logger = logging.getLogger(__name__)
+
+
+# Intents whose handlers never read extracted or stitched entities
+EARLY_EXIT_INTENTS = frozenset({"small_talk", "out_of_domain", "faq"})
+
+
+async def input_analysis_node(state: ProductSearchState) -> ProductSearchState:
+    """
+    Run guardrails (when the supervisor asked for it), intent classification and
+    entity extraction concurrently. None of them reads another's output and each
+    writes its own state keys, so they all work on the same state dict.
+
+    Entity extraction is cancelled if the input is unsafe or the intent comes back
+    as an early-exit intent.
+    """
+    logger.debug("⚡ Analyzing input (safety, intent, entities) in parallel...")
+
+    extraction = asyncio.ensure_future(entity_extractor_node(state))
+    analyses = [intent_classifier_node(state)]
+    if state["next_action"] == "guardrails":
+        analyses.append(guardrails_node(state))
+
+    await asyncio.gather(*analyses)
+
+    # Nothing downstream reads entities after unsafe input or an early-exit intent
+    if (not state["is_safe"] or state["intent"] in EARLY_EXIT_INTENTS) and not extraction.done():
+        extraction.cancel()
+        logger.debug("⏭️ Skipping entity extraction (intent: %s, safe: %s)", state['intent'], state['is_safe'])
+    else:
+        await extraction
+    return state
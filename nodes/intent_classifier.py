@@ -1,54 +1,64 @@
+import logging
+import orjson
 from shopping_assistant.state import ProductSearchState
-from shopping_assistant.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_DEPLOYMENT_NAME, AZURE_API_VERSION
-from openai import AzureOpenAI
+from shopping_assistant.config import AZURE_DEPLOYMENT_NAME, INTENT_CONFIDENCE_THRESHOLD
+from shopping_assistant.semantic_cache import acached_chat
+from shopping_assistant.nodes._batcher import get_batcher
 
-# LLM client
-client = AzureOpenAI(
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version=AZURE_API_VERSION,
-)
+logger = logging.getLogger(__name__)
 
-def intent_classifier_node(state: ProductSearchState) -> ProductSearchState:
-    print("🎯 Classifying user intent...")
+# Local classifier (see design_time/train_intent_classifier.py); None falls back to the LLM
+from shopping_assistant import intent_model as local_classifier
+
+# Static instructions sent as the system message so every call shares the same prefix
+SYSTEM_PROMPT = """You are an intent classifier for a retail shopping assistant.
+Classify the intent of the user input, using the conversation turn and previous context.
+
+Possible intents:
+- product_search
+- faq
+- clarification_response
+- modification
+- continuation
+
+Return only the intent name."""
+
+async def intent_classifier_node(state: ProductSearchState) -> ProductSearchState:
+    logger.debug("🎯 Classifying user intent...")
 
     user_input = state["user_input"]
     turn = state["turn_count"]
     prev_context = state["conversation_memory"].active_context
 
-    prompt = f"""
-    Classify the user intent from: "{user_input}"
-
-    Conversation Turn: {turn}
-    Previous context: {prev_context}
-
-    Possible intents:
-    - product_search
-    - faq
-    - clarification_response
-    - modification
-    - continuation
+    # Confident local predictions skip the Azure round-trip entirely
+    if local_classifier is not None:
+        intent, confidence = local_classifier.predict(user_input)
+        if confidence >= INTENT_CONFIDENCE_THRESHOLD:
+            state["intent"] = intent
+            state["intent_confidence"] = confidence
+            logger.debug("✅ Intent detected locally: %s (%.2f)", intent, confidence)
+            return state
+        logger.debug("🤔 Local intent %s below threshold (%.2f), asking the LLM", intent, confidence)
 
-    Return only the intent name.
-    """
+    user_msg = f'Input: "{user_input}"\nTurn: {turn}\nPrevious context: {orjson.dumps(prev_context).decode()}'
 
     try:
-        response = client.chat.completions.create(
+        content = await acached_chat("intent_classifier", user_input, (turn, prev_context), lambda: get_batcher().submit("intent_classifier", dict(
             model=AZURE_DEPLOYMENT_NAME,
             messages=[
-                {"role": "system", "content": "You are an intent classifier. Return only the intent name."},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_msg}
             ],
             temperature=0,
-            max_tokens=20
-        )
+            max_tokens=8
+        )))
 
-        intent = response.choices[0].message.content.strip().lower()
+        intent = content.strip().lower()
         state["intent"] = intent
-        print(f"✅ Intent detected: {intent}")
+        logger.debug("✅ Intent detected: %s", intent)
 
     except Exception as e:
-        print(f"⚠️ Intent classification error: {e}")
+        logger.warning("⚠️ Intent classification error: %s", e)
         state["intent"] = "product_search"  # safe fallback
 
     return state
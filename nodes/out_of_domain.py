@@ -1,62 +1,59 @@
-import json
+import logging
+import orjson
 from shopping_assistant.state import ProductSearchState
-from shopping_assistant.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_DEPLOYMENT_NAME, AZURE_API_VERSION
+from shopping_assistant.config import AZURE_DEPLOYMENT_NAME
 from langchain_core.messages import AIMessage
-from openai import AzureOpenAI
+from langgraph.types import StreamWriter
+from shopping_assistant.semantic_cache import acached_chat
+from shopping_assistant.nodes._batcher import get_batcher
 
-# LLM client
-client = AzureOpenAI(
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version=AZURE_API_VERSION,
-)
+logger = logging.getLogger(__name__)
 
-def out_of_domain_node(state: ProductSearchState) -> ProductSearchState:
-    print("🚫 Handling out-of-domain query...")
+# Static instructions sent as the system message so every call shares the same prefix
+SYSTEM_PROMPT = """Return out-of-domain classification and helpful redirect. JSON only.
 
-    prompt = f"""
-    The user asked: "{state['user_input']}"
+The user's question is outside a retail shopping assistant's domain.
 
-    This question is outside a retail shopping assistant's domain.
+1. Classify the type: general_knowledge, personal_advice, entertainment, weather, technical_help, or unknown
+2. Return a friendly message that:
+   - Acknowledges the question
+   - Explains you're focused on helping users shop
+   - Invites them to ask about products instead
 
-    1. Classify the type: general_knowledge, personal_advice, entertainment, weather, technical_help, or unknown
-    2. Return a friendly message that:
-       - Acknowledges the question
-       - Explains you're focused on helping users shop
-       - Invites them to ask about products instead
+Return JSON:
+{
+    "category": "entertainment",
+    "response": "That's a fun question! But I'm best at helping you shop. Want to find a product instead?"
+}"""
 
-    Return JSON:
-    {{
-        "category": "entertainment",
-        "response": "That's a fun question! But I'm best at helping you shop. Want to find a product instead?"
-    }}
-    """
+async def out_of_domain_node(state: ProductSearchState, writer: StreamWriter) -> ProductSearchState:
+    logger.debug("🚫 Handling out-of-domain query...")
 
     try:
-        response = client.chat.completions.create(
+        content = await acached_chat("out_of_domain", state["user_input"], (), lambda: get_batcher().submit("out_of_domain", dict(
             model=AZURE_DEPLOYMENT_NAME,
             messages=[
-                {"role": "system", "content": "Return out-of-domain classification and helpful redirect. JSON only."},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f'The user asked: "{state["user_input"]}"'}
             ],
             temperature=0.6,
-            max_tokens=150
-        )
+            max_tokens=150,
+            response_format={"type": "json_object"}
+        )), semantic=True).strip()
 
-        content = response.choices[0].message.content.strip()
-        if content.startswith("```json"):
-            content = content.replace("```json", "").replace("```", "").strip()
-
-        result = json.loads(content)
+        result = orjson.loads(content)
         reply = result.get("response", "I'm here to help with shopping! What would you like to browse?")
+        # The reply is a field inside the model's JSON, so it is written once parsed rather than token by token
+        writer(reply)
         state["agent_response"] = reply
         state["messages"].append(AIMessage(content=reply))
 
-        print(f"📤 Redirected with category: {result.get('category')}")
+        logger.debug("📤 Redirected with category: %s", result.get('category'))
 
     except Exception as e:
-        print(f"⚠️ Out-of-domain error: {e}")
+        logger.warning("⚠️ Out-of-domain error: %s", e)
         fallback = "I’m specialized in helping you find great products. What would you like to shop for today?"
+        writer(fallback)
         state["agent_response"] = fallback
         state["messages"].append(AIMessage(content=fallback))
 
@@ -1,22 +1,38 @@
+import logging
 import json
+from collections import namedtuple
 from shopping_assistant.state import ProductSearchState
-from shopping_assistant.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_DEPLOYMENT_NAME, AZURE_API_VERSION
 from langchain_core.messages import AIMessage
-from openai import AzureOpenAI
+from langgraph.types import StreamWriter
 
-client = AzureOpenAI(
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version=AZURE_API_VERSION,
+logger = logging.getLogger(__name__)
+
+
+# Product fields shown in the listing; image_id (per-item default) and score (from the
+# result, not the metadata) are filled in separately
+Product = namedtuple("Product", "brand product_type color price material fit image_id score")
+_METADATA_FIELDS = (
+    ("brand", "Unknown"),
+    ("product_type", "Product"),
+    ("color", "N/A"),
+    ("price_inr", 0.0),
+    ("material", "N/A"),
+    ("fit", "N/A"),
+)
+_LINE_TMPL = (
+    "{i}. {p.brand} {p.product_type} ({p.color})\n"
+    "   ₹{p.price} | {p.material} | {p.fit} Fit\n"
+    "   ID: {p.image_id} | Quality Score: {p.score}\n\n"
 )
 
-def response_generator_node(state: ProductSearchState) -> ProductSearchState:
-    """Node 6: Generate final response using processed metadata"""
-    print("💬 Generating response...")
+def response_generator_node(state: ProductSearchState, writer: StreamWriter) -> ProductSearchState:
+    """Node 6: Generate final response using processed metadata, streaming it piece by piece"""
+    logger.debug("💬 Generating response...")
     
     if state["needs_clarification"]:
         # Return clarification question
         response = state["clarification_question"]
+        writer(response)
         
     else:
         # Generate product presentation using PROCESSED metadata
@@ -25,7 +41,7 @@ def response_generator_node(state: ProductSearchState) -> ProductSearchState:
         memory = state["conversation_memory"]
         
         if results:
-            print(f"📦 Displaying {len(results)} high-quality products")
+            logger.debug("📦 Displaying %s high-quality products", len(results))
             
             # Use the processed metadata directly (no re-parsing needed!)
             products_data = []
@@ -34,48 +50,44 @@ def response_generator_node(state: ProductSearchState) -> ProductSearchState:
                 # Use the standardized metadata from vector_search_node
                 if "metadata" in item and isinstance(item["metadata"], dict):
                     metadata = item["metadata"]
-                    score = item.get("score", 0.5)
-                    
-                    product_info = {
-                        "product_type": metadata.get("product_type", "Product"),
-                        "brand": metadata.get("brand", "Unknown"),
-                        "color": metadata.get("color", "N/A"),
-                        "material": metadata.get("material", "N/A"),
-                        "price_inr": metadata.get("price_inr", 0.0),
-                        "image_id": metadata.get("image_id", f"item_{i}"),
-                        "fit": metadata.get("fit", "N/A"),
-                        "pattern": metadata.get("pattern", "N/A"),
-                        "score": round(score, 3),
-                        "category": metadata.get("category", "N/A"),
-                        "subcategory": metadata.get("subcategory", "N/A")
-                    }
-                    
-                    products_data.append(product_info)
-                    print(f"📦 Product {i+1}: {product_info['brand']} {product_info['product_type']} - {product_info['color']} (₹{product_info['price_inr']}, Score: {product_info['score']})")
+                    product = Product(
+                        *(metadata.get(key, default) for key, default in _METADATA_FIELDS),
+                        metadata.get("image_id", f"item_{i}"),
+                        round(item.get("score", 0.5), 3),
+                    )
+                    products_data.append(product)
+                    logger.debug("📦 Product %s: %s %s - %s (₹%s, Score: %s)", i+1, product.brand, product.product_type, product.color, product.price, product.score)
                 
                 else:
                     # Fallback for any items that don't have processed metadata
-                    print(f"⚠️ Item {i+1} missing processed metadata, skipping")
+                    logger.warning("⚠️ Item %s missing processed metadata, skipping", i+1)
             
             if products_data:
-                # Generate response using actual product data
-                response = f"Perfect! I found {len(products_data)} excellent matches for your search:\n\n"
+                # Generate response using actual product data; each product is streamed
+                # as soon as it is formatted and the pieces are joined once at the end
+                header = f"Perfect! I found {len(products_data)} excellent matches for your search:\n\n"
+                writer(header)
+                parts = [header]
                 
                 for i, product in enumerate(products_data, 1):
-                    response += f"{i}. {product['brand']} {product['product_type']} ({product['color']})\n"
-                    response += f"   ₹{product['price_inr']} | {product['material']} | {product['fit']} Fit\n"
-                    response += f"   ID: {product['image_id']} | Quality Score: {product['score']}\n\n"
+                    line = _LINE_TMPL.format(i=i, p=product)
+                    writer(line)
+                    parts.append(line)
                     
-                response += f"All products have high similarity scores (>0.6) for your requirements!"
+                footer = "All products have high similarity scores (>0.6) for your requirements!"
                 
                 # Add helpful context
                 if len(results) > len(products_data):
-                    response += f"\n\n({len(results) - len(products_data)} more similar items available)"
+                    footer += f"\n\n({len(results) - len(products_data)} more similar items available)"
+                writer(footer)
+                parts.append(footer)
+                response = "".join(parts)
                     
             else:
                 response = f"""I found {len(results)} matches but couldn't process the product details properly. 
 
 The search results have good similarity scores, but there may be an issue with the data format. Please try refining your search or contact support."""
+                writer(response)
                 
         else:
             response = f"""I couldn't find any high-quality matches for your criteria: {entities}
@@ -84,9 +96,10 @@ Would you like me to:
 - Try with relaxed criteria
 - Search for similar products  
 - Start a new search with different requirements"""
+            writer(response)
     
     state["agent_response"] = response
     state["messages"].append(AIMessage(content=response))
     
-    print(f"✅ Response generated")
+    logger.debug("✅ Response generated")
     return state
\ No newline at end of file
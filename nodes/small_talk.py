@@ -1,52 +1,59 @@
+import logging
 from shopping_assistant.state import ProductSearchState
-from shopping_assistant.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_DEPLOYMENT_NAME, AZURE_API_VERSION
+from shopping_assistant.config import AZURE_DEPLOYMENT_NAME
 from langchain_core.messages import AIMessage
-from openai import AzureOpenAI
+from langgraph.types import StreamWriter
+from shopping_assistant.semantic_cache import acached_chat
+from shopping_assistant.llm_client import stream_complete
 
-# LLM client
-client = AzureOpenAI(
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version=AZURE_API_VERSION,
-)
+logger = logging.getLogger(__name__)
 
-def small_talk_node(state: ProductSearchState) -> ProductSearchState:
-    print("💬 Handling small talk...")
+# Static instructions sent as the system message so every call shares the same prefix
+SYSTEM_PROMPT = """Generate friendly small talk replies with gentle redirection to shopping.
 
-    user_input = state["user_input"]
+The user's message is small talk (greeting, thanks, casual chat). Respond:
+- In a friendly, conversational tone
+- Briefly acknowledge what they said
+- Gently shift back to shopping
+- Keep the tone warm, not robotic
 
-    prompt = f"""
-    The user said: "{user_input}"
+Example:
+"Hi" → "Hello! I'm here to help you find products. What are you shopping for today?"
+"Thanks" → "You're welcome! Anything else I can help you with?"
+"""
 
-    This is small talk (greeting, thanks, casual chat). Respond:
-    - In a friendly, conversational tone
-    - Briefly acknowledge what they said
-    - Gently shift back to shopping
-    - Keep the tone warm, not robotic
+async def small_talk_node(state: ProductSearchState, writer: StreamWriter) -> ProductSearchState:
+    logger.debug("💬 Handling small talk...")
 
-    Example:
-    "Hi" → "Hello! I'm here to help you find products. What are you shopping for today?"
-    "Thanks" → "You're welcome! Anything else I can help you with?"
-    """
+    user_input = state["user_input"]
 
     try:
-        response = client.chat.completions.create(
+        # Tokens go to the graph's custom stream as they arrive; a cache hit is written in one piece
+        streamed = []
+        def on_token(token: str):
+            streamed.append(token)
+            writer(token)
+
+        # Paraphrased greetings ("hi" / "hello there") can share a reply
+        reply = await acached_chat("small_talk", user_input, (), lambda: stream_complete(
+            on_token,
             model=AZURE_DEPLOYMENT_NAME,
             messages=[
-                {"role": "system", "content": "Generate friendly small talk replies with gentle redirection to shopping."},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f'The user said: "{user_input}"'}
             ],
             temperature=0.7,
             max_tokens=80
-        )
-
-        reply = response.choices[0].message.content.strip()
+        ), semantic=True).strip()
+        if not streamed:
+            writer(reply)
         state["agent_response"] = reply
         state["messages"].append(AIMessage(content=reply))
 
     except Exception as e:
-        print(f"⚠️ Small talk error: {e}")
+        logger.warning("⚠️ Small talk error: %s", e)
         fallback = "Hi there! I'm here to help you shop. What are you looking for today?"
+        writer(fallback)
         state["agent_response"] = fallback
         state["messages"].append(AIMessage(content=fallback))
 
@@ -1,15 +1,19 @@
+import logging
 from shopping_assistant.state import ProductSearchState
 from langchain_core.messages import AIMessage
+from langgraph.types import StreamWriter
+
+logger = logging.getLogger(__name__)
 
 try:
-    from text2sql_agent import Text2SQLAgent
+    from text2sql_agent import get_sql_agent
     SQL_AGENT_AVAILABLE = True
 except ImportError:
-    print("⚠️ Text2SQL agent not found. FAQ support disabled.")
+    logger.warning("⚠️ Text2SQL agent not found. FAQ support disabled.")
     SQL_AGENT_AVAILABLE = False
 
-def sql_agent_node(state: ProductSearchState) -> ProductSearchState:
-    print("🧾 Running SQL agent for FAQ...")
+async def sql_agent_node(state: ProductSearchState, writer: StreamWriter) -> ProductSearchState:
+    logger.debug("🧾 Running SQL agent for FAQ...")
 
     if not SQL_AGENT_AVAILABLE:
         response = "❌ SQL agent unavailable. Please install `text2sql_agent.py`."
@@ -19,8 +23,15 @@ def sql_agent_node(state: ProductSearchState) -> ProductSearchState:
         return state
 
     try:
-        sql_agent = Text2SQLAgent()
-        result = sql_agent.query(state["user_input"])
+        sql_agent = get_sql_agent()
+        result = None
+        async for stage, payload in sql_agent.stream_query(state["user_input"]):
+            if stage == "executing":
+                logger.debug("🔍 Generated SQL: %s", payload)
+            elif stage == "done":
+                result = payload
+                # The answer is formatted from the full result set, so it is written once the query has run
+                writer(result["answer"])
 
         # Ensure result is always a dict
         if not isinstance(result, dict):
@@ -33,13 +44,13 @@ def sql_agent_node(state: ProductSearchState) -> ProductSearchState:
         state["sql_results"] = result.get("answer", "")
         state["agent_response"] = result["answer"]
         state["messages"].append(AIMessage(content=result["answer"]))
-        print("✅ SQL result sent.")
+        logger.debug("✅ SQL result sent.")
 
     except Exception as e:
         error_msg = f"❌ SQL agent error: {e}"
         state["sql_results"] = error_msg
         state["agent_response"] = error_msg
         state["messages"].append(AIMessage(content=error_msg))
-        print(error_msg)
+        logger.error(error_msg)
 
     return state
@@ -1,17 +1,110 @@
+import logging
 import json
 from shopping_assistant.state import ProductSearchState
-from shopping_assistant.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_DEPLOYMENT_NAME, AZURE_API_VERSION
-from openai import AzureOpenAI
+from shopping_assistant.config import AZURE_DEPLOYMENT_NAME
+from shopping_assistant.semantic_cache import acached_chat
+from shopping_assistant.llm_client import complete
+from shopping_assistant.nodes.guardrails import local_moderation
+
+logger = logging.getLogger(__name__)
+
+# Static routing instructions sent as the system message so every call shares the same prefix
+SYSTEM_PROMPT = """You are a Supervisor Agent for a retail shopping assistant. Analyze the user input and decide the next action.
+
+DECISION CRITERIA (in priority order):
+
+1. SAFETY CHECK (Priority 1):
+   - Toxic language, harassment, inappropriate content
+   - If unsafe → "guardrails"
+
+2. CART ACTIONS (Priority 2):
+   - EXPLICIT cart commands: "add to cart", "buy this", "I want this", "remove from cart", "show cart", "checkout"
+   - For ADD actions: Route to cart_manager if ANY search results available (current OR historical)
+   - For VIEW/REMOVE/CHECKOUT: always route to cart_manager
+   - Only route to intent_classifier if it's an ADD action with NO search results at all
+   - If explicit cart action → "cart_manager" (unless ADD with zero search results)
+
+3. SMALL TALK (Priority 3):
+   - Greetings: "hi", "hello", "good morning"
+   - Thanks: "thank you", "thanks"
+   - If small talk → "small_talk"
+
+4. OUT OF DOMAIN (Priority 4):
+   - Non-shopping topics: weather, politics, general knowledge
+   - If out of domain → "out_of_domain"
+
+5. ALL OTHER QUERIES (Priority 5):
+   - FAQ/Analytics: "price", "how many", "average", "cheapest", etc.
+   - Product search: "red t-shirt", "Nike shoes", etc.
+   - Clarification responses: "medium", "large", "red", etc.
+   - ALL of these go to → "intent_classifier" (for context processing)
+
+IMPORTANT CHANGE: 
+- NO direct routing to sql_agent anymore
+- ALL queries (FAQ, product search, clarification) go to "intent_classifier"
+- The intent_classifier and context pipeline will handle routing to sql_agent or vector search
+
+EXAMPLES:
+
+CART ACTIONS:
+- "add to cart" + current OR historical search results → "cart_manager"
+- "add to cart" + no search results at all → "intent_classifier" (search first)
+- "show cart", "checkout", "remove" → "cart_manager" (always allow)
+
+ALL OTHER QUERIES → "intent_classifier":
+- "how many wrangler t-shirts?" → "intent_classifier" ✅
+- "average price of them?" → "intent_classifier" ✅
+- "red t-shirt" → "intent_classifier" ✅
+- "medium" → "intent_classifier" ✅
+
+Return JSON only:
+{
+    "action": "guardrails | cart_manager | out_of_domain | small_talk | intent_classifier",
+    "reasoning": "Brief explanation including search results context",
+    "is_safe": true,
+    "is_in_domain": true,
+    "intent": "faq | clarification_response | product_search | cart_action",
+    "confidence": 0.85
+}"""
+
+# Per-turn routing context, sent as the user message
+_SUPERVISOR_PROMPT_TMPL = """User Input: "{user_input}"
+Turn Count: {turn_count}
+Previous Context: {active_context}
+Cart Items: {cart_count}
+
+SEARCH RESULTS CONTEXT:
+- Current search results available: {has_recent} ({n_current} items)
+- Historical search results available: {has_hist}
+- Can add to cart: {can_add}"""
+
+
+
+def _paraphrase_decision_ok(user_input: str, content: str) -> bool:
+    """
+    Whether a decision cached for a paraphrase may be reused for user_input.
+
+    A harmful input can embed close to a benign one, and only the "guardrails" route
+    runs the safety check. A decision that skips guardrails is therefore reused only
+    when the local moderation model confidently clears this input; without the model,
+    such decisions come from the exact cache tier only.
+    """
+    try:
+        action = json.loads(content.strip().removeprefix("```json").removesuffix("```")).get("action")
+    except (ValueError, AttributeError):
+        return False
+    if action == "guardrails":
+        return True
+    try:
+        verdict = local_moderation(user_input)
+    except Exception as e:
+        logger.warning("⚠️ Local moderation error: %s", e)
+        return False
+    return verdict is not None and verdict["is_safe"]
 
-# LLM client initialization
-client = AzureOpenAI(
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version=AZURE_API_VERSION,
-)
 
-def supervisor_node(state: ProductSearchState) -> ProductSearchState:
-    print("🎭 Supervisor analyzing request...")
+async def supervisor_node(state: ProductSearchState) -> ProductSearchState:
+    logger.debug("🎭 Supervisor analyzing request...")
 
     # Get context about available search results
     current_results = state.get("search_results", [])
@@ -26,88 +119,32 @@ def supervisor_node(state: ProductSearchState) -> ProductSearchState:
                 has_historical_search = True
                 break
 
-    prompt = f"""
-    You are a Supervisor Agent for a retail shopping assistant. Analyze the user input and decide the next action.
+    cart_size = len(state.get('shopping_cart', []).items)
 
-    User Input: "{state['user_input']}"
-    Turn Count: {state['turn_count']}
-    Previous Context: {state['conversation_memory'].active_context}
-    Cart Items: {len(state.get('shopping_cart', []).items)}
-    
-    SEARCH RESULTS CONTEXT:
-    - Current search results available: {has_recent_search} ({len(current_results)} items)
-    - Historical search results available: {has_historical_search}
-    - Can add to cart: {has_recent_search or has_historical_search}
-
-    DECISION CRITERIA (in priority order):
-
-    1. SAFETY CHECK (Priority 1):
-       - Toxic language, harassment, inappropriate content
-       - If unsafe → "guardrails"
-
-    2. CART ACTIONS (Priority 2):
-       - EXPLICIT cart commands: "add to cart", "buy this", "I want this", "remove from cart", "show cart", "checkout"
-       - For ADD actions: Route to cart_manager if ANY search results available (current OR historical)
-       - For VIEW/REMOVE/CHECKOUT: always route to cart_manager
-       - Only route to intent_classifier if it's an ADD action with NO search results at all
-       - If explicit cart action → "cart_manager" (unless ADD with zero search results)
-
-    3. SMALL TALK (Priority 3):
-       - Greetings: "hi", "hello", "good morning"
-       - Thanks: "thank you", "thanks"
-       - If small talk → "small_talk"
-
-    4. OUT OF DOMAIN (Priority 4):
-       - Non-shopping topics: weather, politics, general knowledge
-       - If out of domain → "out_of_domain"
-
-    5. ALL OTHER QUERIES (Priority 5):
-       - FAQ/Analytics: "price", "how many", "average", "cheapest", etc.
-       - Product search: "red t-shirt", "Nike shoes", etc.
-       - Clarification responses: "medium", "large", "red", etc.
-       - ALL of these go to → "intent_classifier" (for context processing)
-
-    IMPORTANT CHANGE: 
-    - NO direct routing to sql_agent anymore
-    - ALL queries (FAQ, product search, clarification) go to "intent_classifier"
-    - The intent_classifier and context pipeline will handle routing to sql_agent or vector search
-
-    EXAMPLES:
-    
-    CART ACTIONS:
-    - "add to cart" + current OR historical search results → "cart_manager"
-    - "add to cart" + no search results at all → "intent_classifier" (search first)
-    - "show cart", "checkout", "remove" → "cart_manager" (always allow)
-    
-    ALL OTHER QUERIES → "intent_classifier":
-    - "how many wrangler t-shirts?" → "intent_classifier" ✅
-    - "average price of them?" → "intent_classifier" ✅
-    - "red t-shirt" → "intent_classifier" ✅
-    - "medium" → "intent_classifier" ✅
-
-    Return JSON only:
-    {{
-        "action": "guardrails | cart_manager | out_of_domain | small_talk | intent_classifier",
-        "reasoning": "Brief explanation including search results context",
-        "is_safe": true,
-        "is_in_domain": true,
-        "intent": "faq | clarification_response | product_search | cart_action",
-        "confidence": 0.85
-    }}
-    """
+    user_msg = _SUPERVISOR_PROMPT_TMPL.format(
+        user_input=state["user_input"],
+        turn_count=state["turn_count"],
+        active_context=memory.active_context,
+        cart_count=cart_size,
+        has_recent=has_recent_search,
+        n_current=len(current_results),
+        has_hist=has_historical_search,
+        can_add=has_recent_search or has_historical_search,
+    )
 
     try:
-        response = client.chat.completions.create(
+        # Routing depends on the wording and on whether there is anything to add to or
+        # act on in the cart, so paraphrases in the same situation reuse the decision
+        routing_context = (has_recent_search, has_historical_search, cart_size > 0)
+        content = (await acached_chat("supervisor", state["user_input"], routing_context, lambda: complete(
             model=AZURE_DEPLOYMENT_NAME,
             messages=[
-                {"role": "system", "content": "You are a supervisor that makes routing decisions. Return valid JSON only."},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_msg}
             ],
             temperature=0.1,
             max_tokens=300
-        )
-
-        content = response.choices[0].message.content.strip()
+        ), semantic=True, accept_similar=lambda content: _paraphrase_decision_ok(state["user_input"], content))).strip()
         if content.startswith("```json"):
             content = content.replace("```json", "").replace("```", "").strip()
 
@@ -120,12 +157,12 @@ def supervisor_node(state: ProductSearchState) -> ProductSearchState:
         state["intent"] = decision.get("intent", "product_search")
         state["intent_confidence"] = decision.get("confidence", 0.5)
 
-        print(f"🎯 Decision: {state['next_action']}")
-        print(f"💭 Reasoning: {state['supervisor_reasoning']}")
-        print(f"🔍 Search context: Current={len(current_results)}, Historical={has_historical_search}")
+        logger.debug("🎯 Decision: %s", state['next_action'])
+        logger.debug("💭 Reasoning: %s", state['supervisor_reasoning'])
+        logger.debug("🔍 Search context: Current=%s, Historical=%s", len(current_results), has_historical_search)
 
     except Exception as e:
-        print(f"⚠️ Supervisor error: {e}")
+        logger.warning("⚠️ Supervisor error: %s", e)
         state["next_action"] = "intent_classifier"
         state["supervisor_reasoning"] = "Fallback due to exception"
         state["is_safe"] = True
@@ -1,99 +1,160 @@
+import logging
 from shopping_assistant.state import ProductSearchState
-from shopping_assistant.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_DEPLOYMENT_NAME, AZURE_API_VERSION
+from shopping_assistant.config import AZURE_DEPLOYMENT_NAME
 from langchain_core.messages import AIMessage
 import os
+import re
+import asyncio
 import sqlite3
+import functools
 import json
-from typing import List, Dict, Optional, Any
-from dataclasses import dataclass
-from openai import AzureOpenAI
+from typing import AsyncIterator, List, Dict, Optional, Any, Tuple
+from dataclasses import dataclass, field
+from shopping_assistant.semantic_cache import acached_chat
+from shopping_assistant.nodes._batcher import get_batcher
+from shopping_assistant.llm_client import stream_complete
 
-# Use the same client configuration as other nodes
-client = AzureOpenAI(
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version=AZURE_API_VERSION,
+logger = logging.getLogger(__name__)
+
+
+# SQL generation instructions; rendered once with the schema into Text2SQLAgent.SYSTEM_PROMPT
+_SYSTEM_PROMPT_SQL = """You are an expert SQL query generator for a retail database.
+
+SCHEMA INFORMATION:
+{schema_info}
+
+RULES:
+1. Generate ONLY SELECT statements
+2. Use proper JOINs to connect related tables
+3. Use appropriate WHERE clauses for filtering
+4. Include relevant columns in SELECT
+5. Use LIMIT when appropriate to avoid huge results
+6. Handle price queries with proper numeric comparisons
+7. Use LIKE for partial text matching
+8. Return valid SQLite syntax
+
+EXAMPLES:
+
+Q: "Show me all t-shirts"
+A: SELECT p.product_name, p.brand, p.price_inr, t.color, t.material 
+   FROM products p 
+   JOIN product_types pt ON p.product_type_id = pt.product_type_id
+   JOIN tshirt_attributes t ON p.product_id = t.product_id
+   WHERE pt.product_type_name = 'T-shirt'
+
+Q: "What brands sell t-shirts?"
+A: SELECT DISTINCT p.brand 
+   FROM products p 
+   JOIN product_types pt ON p.product_type_id = pt.product_type_id
+   WHERE pt.product_type_name = 'T-shirt' AND p.brand IS NOT NULL
+
+Q: "How many products under 1000 rupees?"
+A: SELECT COUNT(*) as product_count 
+   FROM products 
+   WHERE price_inr < 1000
+
+Q: "Average price of Nike products"
+A: SELECT AVG(price_inr) as avg_price 
+   FROM products 
+   WHERE brand = 'Nike'
+
+Return ONLY the SQL query, no explanations."""
+
+
+# Statements other than a plain SELECT; word boundaries keep columns like created_at allowed
+_SQL_DANGEROUS_RE = re.compile(
+    r"\b(?:drop|delete|update|insert|alter|create|truncate|replace|exec|execute)\b", re.IGNORECASE
 )
+_SELECT_PREFIX_RE = re.compile(r"^\s*select\b", re.IGNORECASE)
+
 
 @dataclass
 class SQLResult:
     """Result of SQL query execution"""
     success: bool
-    data: List[Dict[str, Any]]
+    data: List[Tuple]  # rows as plain tuples, in column order
     error: Optional[str] = None
     sql_query: str = ""
     execution_time: float = 0.0
+    columns: List[str] = field(default_factory=list)
 
 class Text2SQLAgent:
     """Text to SQL agent for retail database queries"""
     
+    # Static schema description; identical for every instance and every prompt
+    SCHEMA_INFO = """
+    # RETAIL DATABASE SCHEMA
+
+    ## TABLES OVERVIEW:
+
+    ### 1. CATEGORIES
+    - categories (category_id, category_name)
+    - Main product categories like "Fashion", "Electronics", etc.
+
+    ### 2. SUBCATEGORIES  
+    - subcategories (subcategory_id, category_id, subcategory_name)
+    - Linked to categories: "Men's Clothing", "Women's Clothing", "TVs", etc.
+
+    ### 3. PRODUCT_TYPES
+    - product_types (product_type_id, subcategory_id, product_type_name)
+    - Specific product types: "T-shirt", "Jeans", "LED TV", etc.
+
+    ### 4. PRODUCTS (Main table)
+    - products (product_id, product_type_id, product_name, brand, gender, price_inr, image_path)
+    - Contains all products with basic info
+
+    ### 5. TSHIRT_ATTRIBUTES (For t-shirts only)
+    - tshirt_attributes (product_id, color, pattern, sleeve_type, neck_type, fit, material, theme, visual_tags, occlusion)
+    - Additional attributes specific to t-shirts
+
+    ### 6. TV_ATTRIBUTES (For TVs only)
+    - tv_attributes (product_id, screen_size, resolution, display_type, smart_tv, os, ports, design, stand_type, visual_tags, occlusion)
+    - Additional attributes specific to TVs
+
+    ## KEY RELATIONSHIPS:
+    - categories -> subcategories -> product_types -> products
+    - products -> tshirt_attributes (for t-shirts)
+    - products -> tv_attributes (for TVs)
+
+    ## COMMON QUERIES:
+    - Product searches by category, brand, price range
+    - T-shirt specific: color, material, fit, sleeve type
+    - TV specific: screen size, resolution, smart features
+    - Aggregations: count by brand, average price, etc.
+    """
+    
+    # Rendered once per process, so every call sends the same system prompt prefix
+    SYSTEM_PROMPT = _SYSTEM_PROMPT_SQL.format(schema_info=SCHEMA_INFO)
+    
     def __init__(self, db_path: str = "retail.db"):
         self.db_path = db_path
-        self.schema_info = self._build_schema_info()
-        
-    def _build_schema_info(self) -> str:
-        """Build comprehensive schema information for GPT-4.1"""
-        schema_info = """
-        # RETAIL DATABASE SCHEMA
-        
-        ## TABLES OVERVIEW:
-        
-        ### 1. CATEGORIES
-        - categories (category_id, category_name)
-        - Main product categories like "Fashion", "Electronics", etc.
-        
-        ### 2. SUBCATEGORIES  
-        - subcategories (subcategory_id, category_id, subcategory_name)
-        - Linked to categories: "Men's Clothing", "Women's Clothing", "TVs", etc.
-        
-        ### 3. PRODUCT_TYPES
-        - product_types (product_type_id, subcategory_id, product_type_name)
-        - Specific product types: "T-shirt", "Jeans", "LED TV", etc.
-        
-        ### 4. PRODUCTS (Main table)
-        - products (product_id, product_type_id, product_name, brand, gender, price_inr, image_path)
-        - Contains all products with basic info
+        self.schema_info = self.SCHEMA_INFO
+        self._conn = self._connect()
+        # The catalog is read-only within a session, so identical SELECTs reuse their rows;
+        # call self._execute_sql_cached.cache_clear() if the database is ever reloaded
+        self._execute_sql_cached = functools.lru_cache(maxsize=1024)(self._fetch_rows)
         
-        ### 5. TSHIRT_ATTRIBUTES (For t-shirts only)
-        - tshirt_attributes (product_id, color, pattern, sleeve_type, neck_type, fit, material, theme, visual_tags, occlusion)
-        - Additional attributes specific to t-shirts
-        
-        ### 6. TV_ATTRIBUTES (For TVs only)
-        - tv_attributes (product_id, screen_size, resolution, display_type, smart_tv, os, ports, design, stand_type, visual_tags, occlusion)
-        - Additional attributes specific to TVs
-        
-        ## KEY RELATIONSHIPS:
-        - categories -> subcategories -> product_types -> products
-        - products -> tshirt_attributes (for t-shirts)
-        - products -> tv_attributes (for TVs)
-        
-        ## COMMON QUERIES:
-        - Product searches by category, brand, price range
-        - T-shirt specific: color, material, fit, sleeve type
-        - TV specific: screen size, resolution, smart features
-        - Aggregations: count by brand, average price, etc.
-        """
-        return schema_info
     
     def _validate_sql_safety(self, sql_query: str) -> bool:
         """Validate SQL query for safety"""
-        sql_lower = sql_query.lower().strip()
-        
-        # Only allow SELECT statements
-        if not sql_lower.startswith('select'):
-            return False
-            
-        # Disallow dangerous operations
-        dangerous_keywords = [
-            'drop', 'delete', 'update', 'insert', 'alter', 
-            'create', 'truncate', 'replace', 'exec', 'execute'
-        ]
-        
-        for keyword in dangerous_keywords:
-            if keyword in sql_lower:
-                return False
-                
-        return True
+        # Only allow SELECT statements, with no dangerous keyword anywhere in them
+        return bool(_SELECT_PREFIX_RE.match(sql_query)) and _SQL_DANGEROUS_RE.search(sql_query) is None
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open the agent's long-lived connection, tuned for concurrent reads"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.executescript(
+            "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; "
+            "PRAGMA temp_store=MEMORY; PRAGMA cache_size=-64000;"
+        )
+        return conn
+    
+    def _fetch_rows(self, sql_query: str) -> Tuple[List[str], List[Tuple]]:
+        """Run a validated SELECT on the agent's connection; returns (column names, tuple rows)"""
+        cursor = self._conn.execute(sql_query)
+        columns = [d[0] for d in cursor.description]
+        # Plain tuples: format_results only reads a few rows, so no per-row dict is built
+        return columns, cursor.fetchall()
     
     def _execute_sql(self, sql_query: str) -> SQLResult:
         """Execute SQL query safely"""
@@ -109,23 +170,18 @@ class Text2SQLAgent:
             import time
             start_time = time.time()
             
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-                cursor = conn.cursor()
-                cursor.execute(sql_query)
-                rows = cursor.fetchall()
-                
-                # Convert to list of dictionaries
-                data = [dict(row) for row in rows]
-                
-                execution_time = time.time() - start_time
-                
-                return SQLResult(
-                    success=True,
-                    data=data,
-                    sql_query=sql_query,
-                    execution_time=execution_time
-                )
+            # Whitespace-only normalization: lowercasing would also fold string literals
+            columns, data = self._execute_sql_cached(" ".join(sql_query.split()))
+            
+            execution_time = time.time() - start_time
+            
+            return SQLResult(
+                success=True,
+                data=data,
+                sql_query=sql_query,
+                execution_time=execution_time,
+                columns=columns
+            )
                 
         except Exception as e:
             return SQLResult(
@@ -135,80 +191,46 @@ class Text2SQLAgent:
                 sql_query=sql_query
             )
     
-    def natural_language_to_sql(self, question: str) -> str:
+    def _sql_messages(self, question: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user", "content": f"Generate SQL for: {question}"}
+        ]
+    
+    @staticmethod
+    def _clean_sql(sql_query: str) -> str:
+        """Strip whitespace and any markdown fence around the generated SQL"""
+        sql_query = sql_query.strip()
+        if sql_query.startswith("```sql"):
+            sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
+        elif sql_query.startswith("```"):
+            sql_query = sql_query.replace("```", "").strip()
+        return sql_query
+    
+    async def natural_language_to_sql(self, question: str) -> str:
         """Convert natural language question to SQL"""
-        
-        system_prompt = f"""
-        You are an expert SQL query generator for a retail database.
-        
-        SCHEMA INFORMATION:
-        {self.schema_info}
-        
-        RULES:
-        1. Generate ONLY SELECT statements
-        2. Use proper JOINs to connect related tables
-        3. Use appropriate WHERE clauses for filtering
-        4. Include relevant columns in SELECT
-        5. Use LIMIT when appropriate to avoid huge results
-        6. Handle price queries with proper numeric comparisons
-        7. Use LIKE for partial text matching
-        8. Return valid SQLite syntax
-        
-        EXAMPLES:
-        
-        Q: "Show me all t-shirts"
-        A: SELECT p.product_name, p.brand, p.price_inr, t.color, t.material 
-           FROM products p 
-           JOIN product_types pt ON p.product_type_id = pt.product_type_id
-           JOIN tshirt_attributes t ON p.product_id = t.product_id
-           WHERE pt.product_type_name = 'T-shirt'
-           
-        Q: "What brands sell t-shirts?"
-        A: SELECT DISTINCT p.brand 
-           FROM products p 
-           JOIN product_types pt ON p.product_type_id = pt.product_type_id
-           WHERE pt.product_type_name = 'T-shirt' AND p.brand IS NOT NULL
-           
-        Q: "How many products under 1000 rupees?"
-        A: SELECT COUNT(*) as product_count 
-           FROM products 
-           WHERE price_inr < 1000
-           
-        Q: "Average price of Nike products"
-        A: SELECT AVG(price_inr) as avg_price 
-           FROM products 
-           WHERE brand = 'Nike'
-           
-        Return ONLY the SQL query, no explanations.
-        """
-        
-        user_prompt = f"Generate SQL for: {question}"
-        
         try:
-            response = client.chat.completions.create(
+            # temperature=0 makes the SQL a function of the prompt, so repeats are served from the exact cache
+            sql_query = await acached_chat("text2sql", question, self.SYSTEM_PROMPT, lambda: get_batcher().submit("text2sql", dict(
                 model=AZURE_DEPLOYMENT_NAME,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=self._sql_messages(question),
                 temperature=0,
                 max_tokens=500
-            )
-            
-            sql_query = response.choices[0].message.content.strip()
-            
-            # Clean up the response
-            if sql_query.startswith("```sql"):
-                sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-            elif sql_query.startswith("```"):
-                sql_query = sql_query.replace("```", "").strip()
-                
-            return sql_query
+            )))
+            return self._clean_sql(sql_query)
             
         except Exception as e:
-            print(f"Error generating SQL: {e}")
+            logger.warning("Error generating SQL: %s", e)
             return ""
     
+    async def natural_language_to_sql_batch(self, questions: List[str]) -> List[str]:
+        """
+        Convert several questions to SQL at once, e.g. the parts of a compound question.
+        The calls land in the same micro-batcher window, so they go out concurrently
+        (repeats collapsed into one request) and the turn waits for the slowest, not the sum.
+        """
+        return list(await asyncio.gather(*(self.natural_language_to_sql(q) for q in questions)))
+    
     def format_results(self, result: SQLResult, original_question: str) -> str:
         """Format SQL results into natural language"""
         
@@ -221,9 +243,9 @@ class Text2SQLAgent:
         data_count = len(result.data)
         
         # Format based on result type
-        if data_count == 1 and len(result.data[0]) == 1:
+        if data_count == 1 and len(result.columns) == 1:
             # Single value result (like COUNT, AVG)
-            key, value = list(result.data[0].items())[0]
+            value = result.data[0][0]
             
             # Handle None values safely
             if value is None:
@@ -242,7 +264,7 @@ class Text2SQLAgent:
                 
                 # Format each row nicely with None handling
                 row_parts = []
-                for key, value in row.items():
+                for key, value in zip(result.columns, row):
                     if value is not None:
                         if key == 'price_inr':
                             row_parts.append(f"₹{value}")
@@ -274,7 +296,7 @@ class Text2SQLAgent:
             for i, row in enumerate(sample_rows, 1):
                 formatted_response += f"{i}. "
                 row_parts = []
-                for key, value in row.items():
+                for key, value in zip(result.columns, row):
                     if value is not None:
                         if key == 'price_inr':
                             row_parts.append(f"₹{value}")
@@ -295,13 +317,13 @@ class Text2SQLAgent:
             formatted_response += f"\n... and {data_count - 5} more results."
             return formatted_response
     
-    def query(self, question: str, debug: bool = False) -> dict:
+    async def query(self, question: str, debug: bool = False) -> dict:
         """Main method to answer natural language questions"""
     
-        print(f"🤔 Question: {question}")
+        logger.debug("🤔 Question: %s", question)
         
         # Generate SQL
-        sql_query = self.natural_language_to_sql(question)
+        sql_query = await self.natural_language_to_sql(question)
         
         if not sql_query:
             return {
@@ -310,14 +332,14 @@ class Text2SQLAgent:
             }
             
         if debug:
-            print(f"🔍 Generated SQL: {sql_query}")
+            logger.debug("🔍 Generated SQL: %s", sql_query)
         
         # Execute SQL
         result = self._execute_sql(sql_query)
         
         if debug:
-            print(f"⏱️ Execution time: {result.execution_time:.3f}s")
-            print(f"📊 Rows returned: {len(result.data)}")
+            logger.debug("⏱️ Execution time: %.3fs", result.execution_time)
+            logger.debug("📊 Rows returned: %s", len(result.data))
         
         # Format results
         formatted_response = self.format_results(result, question)
@@ -327,10 +349,61 @@ class Text2SQLAgent:
             "answer": formatted_response
         }
 
+    async def stream_query(self, question: str) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming variant of query(), yielding (stage, payload) events as they happen:
+        ("sql_chunk", str) while the SQL is decoded, ("executing", sql), ("columns", names),
+        one ("row", tuple) per result row, then ("done", {"query", "answer"}) - the same
+        dict query() returns.
+        """
+        logger.debug("🤔 Question: %s", question)
+        
+        # Tokens arrive through stream_complete's callback; None marks the end of generation
+        tokens: asyncio.Queue = asyncio.Queue()
+        generation = asyncio.ensure_future(acached_chat("text2sql", question, self.SYSTEM_PROMPT, lambda: stream_complete(
+            tokens.put_nowait,
+            model=AZURE_DEPLOYMENT_NAME,
+            messages=self._sql_messages(question),
+            temperature=0,
+            max_tokens=500
+        )))
+        generation.add_done_callback(lambda _: tokens.put_nowait(None))
+        
+        streamed = False
+        while (token := await tokens.get()) is not None:
+            streamed = True
+            yield "sql_chunk", token
+        
+        try:
+            sql_query = self._clean_sql(generation.result())
+        except Exception as e:
+            logger.warning("Error generating SQL: %s", e)
+            sql_query = ""
+        
+        if not sql_query:
+            yield "done", {"query": "", "answer": "❌ Could not generate SQL query for your question."}
+            return
+        if not streamed:
+            # Served from the cache, so nothing was decoded
+            yield "sql_chunk", sql_query
+        
+        yield "executing", sql_query
+        result = self._execute_sql(sql_query)
+        yield "columns", result.columns
+        for row in result.data:
+            yield "row", row
+        
+        yield "done", {"query": sql_query, "answer": self.format_results(result, question)}
+
+@functools.lru_cache(maxsize=1)
+def get_sql_agent() -> Text2SQLAgent:
+    """Shared agent: schema prompt, sqlite connection and result cache are set up once per process"""
+    return Text2SQLAgent()
+
 # SQL Agent Node for LangGraph integration
-def sql_agent_node(state: ProductSearchState) -> ProductSearchState:
+async def sql_agent_node(state: ProductSearchState) -> ProductSearchState:
     """SQL Agent Node: Handle FAQ/analytics queries with context awareness"""
-    print("🗃️ Processing FAQ query with Text2SQL...")
+    logger.debug("🗃️ Processing FAQ query with Text2SQL...")
     
     # ENHANCEMENT: Context-aware query processing
     user_input = state["user_input"]
@@ -340,11 +413,10 @@ def sql_agent_node(state: ProductSearchState) -> ProductSearchState:
     resolved_query = resolve_contextual_references(user_input, memory)
     
     try:
-        # Initialize SQL agent
-        sql_agent = Text2SQLAgent()
+        sql_agent = get_sql_agent()
         
         # Process the resolved query with debug enabled
-        result = sql_agent.query(resolved_query, debug=True)
+        result = await sql_agent.query(resolved_query, debug=True)
         
         # Ensure result is always a dict
         if not isinstance(result, dict):
@@ -360,16 +432,16 @@ def sql_agent_node(state: ProductSearchState) -> ProductSearchState:
         state["messages"].append(AIMessage(content=result["answer"]))
         
         # ENHANCEMENT: Update conversation memory even for SQL queries
-        update_sql_context(state, resolved_query, result)
+        await update_sql_context(state, resolved_query, result)
         
-        print(f"✅ SQL query completed: {len(result.get('answer', ''))} chars")
+        logger.debug("✅ SQL query completed: %s chars", len(result.get('answer', '')))
         
     except Exception as e:
         error_msg = f"❌ Error processing SQL query: {str(e)}"
         state["sql_results"] = error_msg
         state["agent_response"] = error_msg
         state["messages"].append(AIMessage(content=error_msg))
-        print(f"SQL query error: {e}")
+        logger.warning("SQL query error: %s", e)
     
     return state
 
@@ -390,8 +462,8 @@ def resolve_contextual_references(user_input: str, memory: ConversationMemory) -
     
     # Handle common pronouns and references
     if any(ref in user_lower for ref in ["them", "those", "it", "that"]):
-        print(f"🔗 Resolving contextual reference in: '{user_input}'")
-        print(f"🧠 Available context: {recent_context}")
+        logger.debug("🔗 Resolving contextual reference in: '%s'", user_input)
+        logger.debug("🧠 Available context: %s", recent_context)
         
         # Build context-aware query
         context_parts = []
@@ -410,13 +482,13 @@ def resolve_contextual_references(user_input: str, memory: ConversationMemory) -
             for pronoun in ["them", "those", "it", "that"]:
                 resolved_query = resolved_query.replace(pronoun, context_string)
             
-            print(f"✅ Resolved query: '{resolved_query}'")
+            logger.debug("✅ Resolved query: '%s'", resolved_query)
             return resolved_query
     
     # No resolution needed
     return user_input
 
-def update_sql_context(state: ProductSearchState, resolved_query: str, sql_result: dict):
+async def update_sql_context(state: ProductSearchState, resolved_query: str, sql_result: dict):
     """Update conversation context after SQL query"""
     
     # Extract any entities from the resolved query
@@ -430,7 +502,7 @@ def update_sql_context(state: ProductSearchState, resolved_query: str, sql_resul
     temp_state["image_path"] = None
     
     # Extract entities from resolved query
-    temp_state = entity_extractor_node(temp_state)
+    temp_state = await entity_extractor_node(temp_state)
     extracted_entities = temp_state.get("raw_entities", {})
     
     # Update conversation memory
@@ -448,5 +520,5 @@ def update_sql_context(state: ProductSearchState, resolved_query: str, sql_resul
     # Update active context
     state["conversation_memory"].active_context.update(extracted_entities)
     
-    print(f"🧵 Updated SQL context: {extracted_entities}")
-    print(f"🧠 Active context: {state['conversation_memory'].active_context}")
\ No newline at end of file
+    logger.debug("🧵 Updated SQL context: %s", extracted_entities)
+    logger.debug("🧠 Active context: %s", state['conversation_memory'].active_context)
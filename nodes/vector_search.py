@@ -1,13 +1,118 @@
+import logging
+import copy
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
 from shopping_assistant.state import ProductSearchState
+from shopping_assistant.config import LLM_CACHE_ENABLED
 from shopping_assistant.utils.embedding import get_text_embedding, get_image_embedding
 from shopping_assistant.utils.search import search_products
 from shopping_assistant.schema import ConversationTurn
 from datetime import datetime
-import json
+import orjson
 
-def vector_search_node(state: ProductSearchState) -> ProductSearchState:
+logger = logging.getLogger(__name__)
+
+# Standard metadata fields and the value used when a result does not carry one
+_METADATA_DEFAULTS = {
+    "product_type": "Product",
+    "brand": "Unknown",
+    "color": "N/A",
+    "material": "N/A",
+    "gender": "Unisex",
+    "size": "N/A",
+    "pattern": "N/A",
+    "theme": "N/A",
+    "image_id": "unknown",
+    "fit": "N/A",
+    "sleeve_type": "N/A",
+    "neck_type": "N/A",
+}
+
+# Processed results of recent searches, keyed on _search_cache_key (LRU)
+SEARCH_CACHE_SIZE = 256
+_search_cache: "OrderedDict[Tuple[bytes, Optional[str]], List[dict]]" = OrderedDict()
+
+
+def _search_cache_key(entities: dict, image_path: Optional[str]) -> Optional[Tuple[bytes, Optional[str]]]:
+    """Canonical entity JSON plus a content hash of the query image, if any; None if the image is unreadable"""
+    image_hash = None
+    if image_path:
+        try:
+            with open(image_path, "rb") as f:
+                image_hash = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        except OSError:
+            return None
+    return orjson.dumps(entities, option=orjson.OPT_SORT_KEYS), image_hash
+
+
+async def _search(state: ProductSearchState, search_text: str) -> Optional[List[dict]]:
+    """Embed the query, search Weaviate and normalize the results; None if no embedding could be made"""
+    # Generate embeddings
+    final_embedding = None
+    
+    if state["has_image"] and state["image_path"]:
+        logger.debug("🖼️ Processing hybrid search (image + text)...")
+        
+        # Get both embeddings concurrently (the embedding service client is blocking, so each runs in a thread)
+        image_embedding, text_embedding = await asyncio.gather(
+            asyncio.to_thread(get_image_embedding, state["image_path"]),
+            asyncio.to_thread(get_text_embedding, search_text),
+        )
+        
+        if image_embedding and text_embedding:
+            logger.debug("🔀 Combining embeddings: Image(80%) + Text(20%)")
+            # search_products posts the vector as JSON, so the blend goes back to a list
+            final_embedding = (np.asarray(image_embedding) * 0.8 + np.asarray(text_embedding) * 0.2).tolist()
+        elif image_embedding:
+            final_embedding = image_embedding
+        elif text_embedding:
+            final_embedding = text_embedding
+    else:
+        logger.debug("📝 Processing text search...")
+        final_embedding = await asyncio.to_thread(get_text_embedding, search_text)
+    
+    if not final_embedding:
+        return None
+    
+    # Search vector database
+    raw_results = await asyncio.to_thread(search_products, final_embedding, limit=20)
+    
+    # ENHANCED: Process and normalize metadata for all results
+    processed_results = []
+    for i, result in enumerate(raw_results):
+        try:
+            # Extract and normalize metadata
+            metadata = extract_metadata_from_result(result)
+            
+            # Create standardized result structure
+            processed_result = {
+                "score": extract_score_from_result(result),
+                "metadata": metadata,
+                "raw_result": result,  # Keep original for debugging
+                "index": i
+            }
+            
+            processed_results.append(processed_result)
+            logger.debug("✅ Processed result %s: %s %s - ₹%s", i+1, metadata.get('brand', 'Unknown'), metadata.get('product_type', 'Product'), metadata.get('price_inr', 0))
+            
+        except Exception as e:
+            logger.warning("⚠️ Failed to process result %s: %s", i+1, e)
+            # Keep raw result as fallback
+            processed_results.append({
+                "score": 0.5,
+                "metadata": {},
+                "raw_result": result,
+                "index": i
+            })
+    
+    return processed_results
+
+async def vector_search_node(state: ProductSearchState) -> ProductSearchState:
     """Node 4: Search Weaviate with hybrid embedding + full metadata preservation"""
-    print("🔍 Searching vector database...")
+    logger.debug("🔍 Searching vector database...")
     
     entities = state["stitched_entities"]
     
@@ -18,66 +123,30 @@ def vector_search_node(state: ProductSearchState) -> ProductSearchState:
             search_parts.append(f"{key}: {value}")
     
     search_text = ". ".join(search_parts) if search_parts else state["user_input"]
-    print(f"📝 Search text: {search_text}")
+    logger.debug("📝 Search text: %s", search_text)
     
-    # Generate embeddings
-    final_embedding = None
+    # The same stitched entities (and image) give the same results, so repeats skip
+    # embedding, search and processing. Without entities the raw input is searched: not cached.
+    cache_key = None
+    if entities and LLM_CACHE_ENABLED:
+        cache_key = _search_cache_key(entities, state["image_path"] if state["has_image"] else None)
     
-    if state["has_image"] and state["image_path"]:
-        print("🖼️ Processing hybrid search (image + text)...")
-        
-        # Get both embeddings
-        image_embedding = get_image_embedding(state["image_path"])
-        text_embedding = get_text_embedding(search_text)
-        
-        if image_embedding and text_embedding:
-            print("🔀 Combining embeddings: Image(80%) + Text(20%)")
-            final_embedding = []
-            for i in range(len(image_embedding)):
-                combined_value = (image_embedding[i] * 0.8) + (text_embedding[i] * 0.2)
-                final_embedding.append(combined_value)
-        elif image_embedding:
-            final_embedding = image_embedding
-        elif text_embedding:
-            final_embedding = text_embedding
+    if cache_key is not None and cache_key in _search_cache:
+        _search_cache.move_to_end(cache_key)
+        # Later nodes and the turn history hold on to the results, so hand out a copy
+        processed_results = copy.deepcopy(_search_cache[cache_key])
+        logger.debug("⚡ Search cache hit")
     else:
-        print("📝 Processing text search...")
-        final_embedding = get_text_embedding(search_text)
+        processed_results = await _search(state, search_text)
+        # Empty results may be a failed search, so only real hits are kept
+        if processed_results and cache_key is not None:
+            _search_cache[cache_key] = copy.deepcopy(processed_results)
+            if len(_search_cache) > SEARCH_CACHE_SIZE:
+                _search_cache.popitem(last=False)
     
-    # Search vector database
-    if final_embedding:
-        raw_results = search_products(final_embedding, limit=20)
-        
-        # ENHANCED: Process and normalize metadata for all results
-        processed_results = []
-        for i, result in enumerate(raw_results):
-            try:
-                # Extract and normalize metadata
-                metadata = extract_metadata_from_result(result)
-                
-                # Create standardized result structure
-                processed_result = {
-                    "score": extract_score_from_result(result),
-                    "metadata": metadata,
-                    "raw_result": result,  # Keep original for debugging
-                    "index": i
-                }
-                
-                processed_results.append(processed_result)
-                print(f"✅ Processed result {i+1}: {metadata.get('brand', 'Unknown')} {metadata.get('product_type', 'Product')} - ₹{metadata.get('price_inr', 0)}")
-                
-            except Exception as e:
-                print(f"⚠️ Failed to process result {i+1}: {e}")
-                # Keep raw result as fallback
-                processed_results.append({
-                    "score": 0.5,
-                    "metadata": {},
-                    "raw_result": result,
-                    "index": i
-                })
-        
+    if processed_results is not None:
         state["search_results"] = processed_results
-        print(f"✅ Found and processed {len(processed_results)} products")
+        logger.debug("✅ Found and processed %s products", len(processed_results))
         
         # Update memory with processed results
         current_turn = ConversationTurn(
@@ -91,7 +160,7 @@ def vector_search_node(state: ProductSearchState) -> ProductSearchState:
         state["conversation_memory"].add_turn(current_turn)
         
     else:
-        print("❌ Failed to generate embedding")
+        logger.error("❌ Failed to generate embedding")
         state["search_results"] = []
     
     return state
@@ -115,32 +184,20 @@ def extract_metadata_from_result(result: dict) -> dict:
     # Parse JSON string if needed
     if isinstance(raw_metadata, str):
         try:
-            metadata = json.loads(raw_metadata)
+            metadata = orjson.loads(raw_metadata)
         except Exception as e:
-            print(f"❌ Failed to parse metadata JSON: {e}")
+            logger.error("❌ Failed to parse metadata JSON: %s", e)
             metadata = {}
     else:
         metadata = raw_metadata if isinstance(raw_metadata, dict) else {}
     
-    # Ensure all standard fields exist with defaults
-    standardized_metadata = {
-        "product_type": metadata.get("product_type", "Product"),
-        "brand": metadata.get("brand", "Unknown"),
-        "color": metadata.get("color", "N/A"),
-        "material": metadata.get("material", "N/A"),
-        "gender": metadata.get("gender", "Unisex"),
-        "size": metadata.get("size", "N/A"),
-        "pattern": metadata.get("pattern", "N/A"),
-        "theme": metadata.get("theme", "N/A"),
-        "price_inr": float(metadata.get("price_inr", 0.0)),
-        "image_id": metadata.get("image_id", "unknown"),
-        "fit": metadata.get("fit", "N/A"),
-        "sleeve_type": metadata.get("sleeve_type", "N/A"),
-        "neck_type": metadata.get("neck_type", "N/A"),
-        "visual_tags": metadata.get("visual_tags", []),
-        "category": result.get("data", {}).get("category", "Fashion"),
-        "subcategory": result.get("data", {}).get("subcategory", "Clothing")
-    }
+    # Ensure all standard fields exist with defaults (one merge instead of a get per field)
+    standardized_metadata = _METADATA_DEFAULTS | metadata
+    standardized_metadata["price_inr"] = float(metadata.get("price_inr", 0.0))
+    standardized_metadata.setdefault("visual_tags", [])  # fresh list per result, never shared
+    data = result.get("data", {})
+    standardized_metadata["category"] = data.get("category", "Fashion")
+    standardized_metadata["subcategory"] = data.get("subcategory", "Clothing")
     
     return standardized_metadata
 
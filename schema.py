@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 
 @dataclass
@@ -19,6 +19,8 @@ class ShoppingCart:
     """Session shopping cart"""
     items: List[CartItem] = field(default_factory=list)
     total_amount: float = 0.0
+    # Rendered get_summary() text; cleared whenever the items change
+    _summary_cache: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
     def add_item(self, item: CartItem):
         for existing in self.items:
@@ -38,20 +40,24 @@ class ShoppingCart:
         self._calculate_total()
 
     def _calculate_total(self):
+        # Called after every mutation, so it also invalidates the cached summary
         self.total_amount = sum(item.price * item.quantity for item in self.items)
+        self._summary_cache = None
 
     def get_summary(self) -> str:
         if not self.items:
             return "🛒 Your cart is empty"
 
-        summary = f"🛒 Cart Summary ({len(self.items)} items):\n\n"
-        for i, item in enumerate(self.items, 1):
-            summary += (
-                f"{i}. {item.brand} {item.product_name} - {item.color}\n"
-                f"   ₹{item.price} x {item.quantity} = ₹{item.price * item.quantity}\n\n"
-            )
-        summary += f"💰 Total: ₹{self.total_amount:,.2f}"
-        return summary
+        if self._summary_cache is None:
+            lines = [f"🛒 Cart Summary ({len(self.items)} items):\n\n"]
+            for i, item in enumerate(self.items, 1):
+                lines.append(
+                    f"{i}. {item.brand} {item.product_name} - {item.color}\n"
+                    f"   ₹{item.price} x {item.quantity} = ₹{item.price * item.quantity}\n\n"
+                )
+            lines.append(f"💰 Total: ₹{self.total_amount:,.2f}")
+            self._summary_cache = "".join(lines)
+        return self._summary_cache
 
 
 @dataclass
@@ -72,15 +78,18 @@ class ConversationMemory:
     turn_history: List[ConversationTurn] = field(default_factory=list)
     successful_searches: List[Dict] = field(default_factory=list)
     clarification_count: int = 0
+    # Most recent turn that returned search results, kept up to date by add_turn
+    last_results_turn: Optional[ConversationTurn] = None
+    # Append-only chat history sent to the stitcher, so each call extends the previous prefix
+    stitcher_messages: List[Dict] = field(default_factory=list)
 
     def add_turn(self, turn: ConversationTurn):
         self.turn_history.append(turn)
+        if turn.search_results:
+            self.last_results_turn = turn
 
     def get_last_entities(self) -> Dict:
         return self.turn_history[-1].extracted_entities if self.turn_history else {}
 
     def get_last_successful_search(self) -> Dict:
-        for turn in reversed(self.turn_history):
-            if turn.search_results:
-                return turn.extracted_entities
-        return {}
+        return self.last_results_turn.extracted_entities if self.last_results_turn else {}
@@ -0,0 +1,175 @@
+import logging
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+import numpy as np
+
+from shopping_assistant.config import LLM_CACHE_ENABLED, LLM_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD
+import shopping_assistant
+from shopping_assistant import embedder
+
+logger = logging.getLogger(__name__)
+
+# Candidates taken from vector retrieval before re-ranking on the context hash
+_TOP_K = 5
+
+# Stored embeddings are normalized, so float16 keeps cosine scores to ~1e-3 (well inside
+# the threshold margin) at half the memory. numpy has no float16 BLAS kernel, so scores
+# are computed in float32
+_VECTOR_DTYPE = np.float16
+
+
+def _context_hash(context: Any) -> str:
+    """Stable hash of the state slice a prompt depends on (besides the user text)"""
+    return hashlib.sha256(json.dumps(context, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SemanticCache:
+    """
+    Node response cache with two lookup modes.
+
+    Exact: keyed on sha256(node, user text, context) - safe for any prompt, used for
+    the deterministic/structured nodes (intent, guardrails, entities, stitching).
+    Semantic: cosine similarity of the user text embedding, then the top-k
+    candidates are re-ranked by exact context-hash match, so a paraphrase only
+    hits when the rest of the prompt is identical.
+    """
+
+    def __init__(self, max_entries: int = LLM_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._exact: "OrderedDict[str, str]" = OrderedDict()
+        # Per node: normalized float16 embeddings (n, d) and matching (context_hash, response) rows
+        self._vectors: dict = {}
+        self._rows: dict = {}
+        self._lock = threading.Lock()
+
+    def _exact_key(self, node_name: str, key_text: str, context_hash: str) -> str:
+        return hashlib.sha256(f"{node_name}\0{key_text}\0{context_hash}".encode()).hexdigest()
+
+    def get_exact(self, key: str) -> Optional[str]:
+        with self._lock:
+            response = self._exact.get(key)
+            if response is not None:
+                self._exact.move_to_end(key)
+            return response
+
+    def put_exact(self, key: str, response: str):
+        with self._lock:
+            self._exact[key] = response
+            if len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+
+    def get_similar(self, node_name: str, vector: np.ndarray, context_hash: str) -> Optional[str]:
+        with self._lock:
+            matrix = self._vectors.get(node_name)
+            if matrix is None or not len(matrix):
+                return None
+            scores = matrix.astype(np.float32, copy=False) @ vector.astype(np.float32, copy=False)
+            k = min(_TOP_K, len(scores))
+            candidates = np.argpartition(-scores, k - 1)[:k]
+            for idx in candidates[np.argsort(-scores[candidates])]:
+                if scores[idx] < self.threshold:
+                    break
+                row_context, response = self._rows[node_name][idx]
+                if row_context == context_hash:
+                    return response
+            return None
+
+    def put_similar(self, node_name: str, vector: np.ndarray, context_hash: str, response: str):
+        vector = vector.astype(_VECTOR_DTYPE)
+        with self._lock:
+            matrix = self._vectors.get(node_name)
+            rows = self._rows.setdefault(node_name, [])
+            matrix = vector[None, :] if matrix is None else np.vstack([matrix, vector])
+            rows.append((context_hash, response))
+            if len(rows) > self.max_entries:
+                matrix = matrix[1:]
+                del rows[0]
+            self._vectors[node_name] = matrix
+
+
+_cache = SemanticCache()
+
+
+def _lookup_exact(node_name: str, key_text: str, context: Any):
+    """Exact-tier lookup; returns (response or None, context_hash, exact_key)"""
+    context_hash = _context_hash(context)
+    exact_key = _cache._exact_key(node_name, key_text, context_hash)
+    response = _cache.get_exact(exact_key)
+    if response is not None:
+        logger.debug("⚡ %s: cache hit", node_name)
+    return response, context_hash, exact_key
+
+
+def _lookup_similar(node_name: str, vector: np.ndarray, context_hash: str, exact_key: str,
+                    accept_similar: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+    response = _cache.get_similar(node_name, vector, context_hash)
+    if response is not None and accept_similar is not None and not accept_similar(response):
+        logger.debug("🔁 %s: semantic cache hit rejected, calling the LLM", node_name)
+        return None
+    if response is not None:
+        logger.debug("⚡ %s: semantic cache hit", node_name)
+        _cache.put_exact(exact_key, response)
+    return response
+
+
+def _store(node_name: str, exact_key: str, context_hash: str, vector: Optional[np.ndarray], response: str):
+    _cache.put_exact(exact_key, response)
+    if vector is not None:
+        _cache.put_similar(node_name, vector, context_hash, response)
+
+
+def cached_chat(node_name: str, key_text: str, context: Any, call_fn: Callable[[], str],
+                semantic: bool = False, accept_similar: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    Return the cached LLM reply for this node/input/context, or call call_fn and cache it.
+
+    key_text is the user-facing text of the prompt and context everything else the
+    prompt is built from. semantic=True additionally matches paraphrases of key_text
+    (use only where a paraphrase should get the same reply, e.g. small talk);
+    accept_similar, if given, vets each paraphrase hit and a False makes it a miss.
+    Errors from call_fn propagate and are not cached.
+    """
+    if not LLM_CACHE_ENABLED:
+        return call_fn()
+
+    response, context_hash, exact_key = _lookup_exact(node_name, key_text, context)
+    if response is not None:
+        return response
+
+    vector = None
+    if semantic and shopping_assistant.embedding_model is not None:
+        vector = embedder.embed_batch([key_text])[0]
+        response = _lookup_similar(node_name, vector, context_hash, exact_key, accept_similar)
+        if response is not None:
+            return response
+
+    response = call_fn()
+    _store(node_name, exact_key, context_hash, vector, response)
+    return response
+
+
+async def acached_chat(node_name: str, key_text: str, context: Any,
+                       call_fn: Callable[[], Awaitable[str]], semantic: bool = False,
+                       accept_similar: Optional[Callable[[str], bool]] = None) -> str:
+    """Async variant of cached_chat; embeddings go through the shared embedding batcher"""
+    if not LLM_CACHE_ENABLED:
+        return await call_fn()
+
+    response, context_hash, exact_key = _lookup_exact(node_name, key_text, context)
+    if response is not None:
+        return response
+
+    vector = await embedder.embed(key_text) if semantic else None
+    if vector is not None:
+        response = _lookup_similar(node_name, vector, context_hash, exact_key, accept_similar)
+        if response is not None:
+            return response
+
+    response = await call_fn()
+    _store(node_name, exact_key, context_hash, vector, response)
+    return response
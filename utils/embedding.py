@@ -1,8 +1,11 @@
+import logging
 import requests
 from typing import List, Optional
 import os
 from shopping_assistant.config import EMBEDDING_URL
 
+logger = logging.getLogger(__name__)
+
 
 def get_text_embedding(text: str) -> Optional[List[float]]:
     """Generate text embedding from embedding service"""
@@ -20,9 +23,9 @@ def get_text_embedding(text: str) -> Optional[List[float]]:
                 or (result if isinstance(result, list) else None)
             )
         else:
-            print(f"⚠️ Text embedding failed: {response.status_code}")
+            logger.warning("⚠️ Text embedding failed: %s", response.status_code)
     except Exception as e:
-        print(f"🚨 Text embedding error: {e}")
+        logger.error("🚨 Text embedding error: %s", e)
     return None
 
 
@@ -44,7 +47,7 @@ def get_image_embedding(image_path: str) -> Optional[List[float]]:
                 or (result if isinstance(result, list) else None)
             )
         else:
-            print(f"⚠️ Image embedding failed: {response.status_code}")
+            logger.warning("⚠️ Image embedding failed: %s", response.status_code)
     except Exception as e:
-        print(f"🚨 Image embedding error: {e}")
+        logger.error("🚨 Image embedding error: %s", e)
     return None
@@ -0,0 +1,60 @@
+import logging
+import os
+import json
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class OnnxTextClassifier:
+    """
+    Sequence classifier exported to ONNX, run on CPU with onnxruntime.
+
+    The model directory holds model.onnx, the tokenizer files and labels.json
+    (label names in logit order).
+    """
+
+    def __init__(self, model_dir: str):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        with open(os.path.join(model_dir, "labels.json")) as f:
+            self.labels = json.load(f)
+
+    def logits(self, text: str) -> np.ndarray:
+        encoded = self.tokenizer(text, truncation=True, max_length=128, return_tensors="np")
+        feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+        return self.session.run(None, feeds)[0][0]
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Single-label prediction: (label, softmax probability)"""
+        logits = self.logits(text)
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best])
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Multi-label prediction: independent sigmoid score per label"""
+        probs = 1.0 / (1.0 + np.exp(-self.logits(text)))
+        return dict(zip(self.labels, probs.tolist()))
+
+
+def load_onnx_classifier(model_dir: str) -> Optional[OnnxTextClassifier]:
+    """Load a classifier from model_dir; None if unset, missing or onnxruntime is unavailable"""
+    if not model_dir or not os.path.exists(os.path.join(model_dir, "model.onnx")):
+        return None
+    try:
+        classifier = OnnxTextClassifier(model_dir)
+    except Exception as e:
+        logger.warning("⚠️ Could not load local classifier from %s: %s", model_dir, e)
+        return None
+    logger.debug("✅ Loaded local classifier: %s", model_dir)
+    return classifier
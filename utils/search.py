@@ -1,7 +1,10 @@
+import logging
 import requests
 from typing import List, Dict, Optional
 from shopping_assistant.config import WEAVIATE_URL, COLLECTION_NAME, AUTH_TOKEN
 
+logger = logging.getLogger(__name__)
+
 
 def search_products(query_vector: List[float], limit: int = 20) -> List[Dict]:
     """Search Weaviate vector database using a query vector"""
@@ -34,8 +37,8 @@ def search_products(query_vector: List[float], limit: int = 20) -> List[Dict]:
                 or (result if isinstance(result, list) else [])
             )
         else:
-            print(f"⚠️ Vector search failed: {response.status_code}")
+            logger.warning("⚠️ Vector search failed: %s", response.status_code)
     except Exception as e:
-        print(f"🚨 Vector search exception: {e}")
+        logger.error("🚨 Vector search exception: %s", e)
 
     return []